@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Title: Benchmarks for the finger tapping task
+Run from the command line, e.g. 'python benchmark.py scoring'. Each benchmark prints its timings.
+
+"""
+
+# import useful modules
+import argparse
+import os
+import shutil
+import tempfile
+import timeit
+import numpy as np
+from scoring import patternDetect, batchPatternDetect, packStreams
+from simulation import SyntheticTypist, runSession
+from replay import replayDirectory
+from scoringChecks import scorers, referenceScores
+
+# A routine to generate random response streams that look like real trials (mostly correct sequences with slips)
+def makeStreams(nStreams, targetSequence, meanLength=150, errorRate=0.05, seed=0):
+    rng = np.random.RandomState(seed)  # seeded so every run uses the same streams
+    targetSequence = list(map(int, list(targetSequence)))
+    streams = []
+    for n in range(nStreams):
+        length = rng.poisson(meanLength)  # number of key presses in this trial
+        stream = np.resize(targetSequence, length)  # typed the target sequence over and over
+        slips = rng.rand(length) < errorRate  # choose which presses were errors
+        stream[slips] = rng.randint(1, 5, slips.sum())  # replace them with random keys
+        streams.append([int(item) for item in stream])
+    return streams
+
+# Benchmark the batch scorer against the per-trial loop and check they agree
+def benchmarkScoring(nStreams=5000, targetSequence='41324', repeats=3):
+    streams = makeStreams(nStreams, targetSequence)
+    values, offsets = packStreams(streams)
+
+    loopTime = min(timeit.repeat(lambda: [patternDetect(stream, targetSequence) for stream in streams],
+                                 number=1, repeat=repeats))
+    batchTime = min(timeit.repeat(lambda: batchPatternDetect(values, targetSequence, offsets=offsets),
+                                  number=1, repeat=repeats))
+
+    # check results are identical
+    reference = [patternDetect(stream, targetSequence) for stream in streams]
+    output = batchPatternDetect(values, targetSequence, offsets=offsets)
+    for measure in ['speed', 'errors', 'accuracy']:
+        expected = np.array([row[measure] for row in reference])
+        assert np.array_equal(expected, output[measure], equal_nan=True), 'batch scorer disagrees on %s' % measure
+
+    print('Scoring %i trials with target sequence %s' % (nStreams, targetSequence))
+    print('  patternDetect loop:  %.3f seconds' % loopTime)
+    print('  batchPatternDetect:  %.3f seconds (%.1fx faster)' % (batchTime, loopTime / batchTime))
+
+# Benchmark how fast the tapping loop handles key presses without losing any (headless, one practice trial per rate)
+# the simulated clock runs speed times faster than real time, so the real key rate is tapRate * speed
+def benchmarkLoop(tapRates=(10, 50, 100, 200), speed=10.0):
+    workDir = tempfile.mkdtemp()
+    try:
+        print('Tapping loop throughput (headless, %gx real time)' % speed)
+        for tapRate in tapRates:
+            result = runSession(SyntheticTypist(tapRate=tapRate, timing='exponential'), workDir=workDir,
+                                speed=speed, practice=True)
+            print('  %6i keys/s: %6i keys, %i lost, %i trials reordered, lag mean %.2f ms, max %.2f ms' % (
+                tapRate * speed, result['keysDelivered'], result['keysLost'], result['trialsReordered'],
+                1000 * result['meanLag'] / speed, 1000 * result['maxLag'] / speed))
+    finally:
+        shutil.rmtree(workDir)
+
+# Benchmark a whole first session end to end (headless), including scoring and saving
+def benchmarkSession(speed=100.0):
+    workDir = tempfile.mkdtemp()
+    try:
+        result = runSession(SyntheticTypist(), workDir=workDir, speed=speed)
+        print('Session 1 (headless, %gx real time): %i trials, %i keys, %i lost' % (
+            speed, len(result['trials']), result['keysDelivered'], result['keysLost']))
+        print('  %.1f simulated seconds in %.2f real seconds' % (result['simulatedTime'], result['realTime']))
+    finally:
+        shutil.rmtree(workDir)
+
+# Benchmark replaying recorded sessions (unthrottled) through the input path, markers and scoring, checking each trial
+# uses a simulated first session unless given a data directory
+def benchmarkReplay(dataDir=None):
+    workDir = None
+    if dataDir is None:
+        workDir = tempfile.mkdtemp()
+        runSession(SyntheticTypist(), workDir=workDir, speed=100.0)
+        dataDir = os.path.join(workDir, 'data')
+    try:
+        results, duration = replayDirectory(dataDir)
+        nKeys = sum(result['keys'] for result in results)
+        print('Replay (unthrottled): %i trials, %i keys in %.3f seconds (%.0f keys/s), %i trials did not match' % (
+            len(results), nKeys, duration, nKeys / duration, sum(bool(result['problems']) for result in results)))
+    finally:
+        if workDir is not None:
+            shutil.rmtree(workDir)
+
+# Benchmark the throughput (keys scored per second) of patternDetect and every other scorer, for stream lengths from
+# 10 to 10^6 keys. Short streams are scored many at a time so each timing covers about totalKeys keys
+def benchmarkThroughput(lengths=(10, 100, 1000, 10000, 100000, 1000000), targetSequence='41324', totalKeys=100000):
+    implementations = dict(scorers, patternDetect=referenceScores)
+    names = ['patternDetect'] + sorted(scorers)
+    print('Scoring throughput (thousand keys per second) by stream length')
+    print('  %-28s' % 'length' + ''.join('%10i' % length for length in lengths))
+    streams = dict((length, makeStreams(max(totalKeys // length, 1), targetSequence, meanLength=length))
+                   for length in lengths)
+    for name in names:
+        rates = []
+        for length in lengths:
+            nKeys = sum(len(stream) for stream in streams[length])
+            seconds = min(timeit.repeat(lambda: implementations[name](streams[length], targetSequence),
+                                        number=1, repeat=2))
+            rates.append(nKeys / seconds / 1000)
+        print('  %-28s' % name + ''.join('%10.0f' % rate for rate in rates))
+
+benchmarks = {'scoring': benchmarkScoring, 'loop': benchmarkLoop, 'session': benchmarkSession,
+              'replay': benchmarkReplay, 'throughput': benchmarkThroughput}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run finger tapping task benchmarks')
+    parser.add_argument('names', nargs='*', metavar='name', help='benchmarks to run: %s (default: all)' %
+                        ', '.join(sorted(benchmarks)))
+    args = parser.parse_args()
+    for name in args.names or sorted(benchmarks):
+        benchmarks[name]()
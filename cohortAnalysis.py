@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Title: Cohort analysis for the finger tapping task
+Finds every participant data file in the data directory, re-scores all response streams and writes one summary file
+with mean speed, errors, accuracy and intrusions of the other task sequences per participant, session and sequence
+type, plus the session 3 old vs. new contrast. Participants are processed in parallel, one per worker process.
+
+Run from the command line, e.g. 'python cohortAnalysis.py --dataDir data --output data/cohortSummary.csv'
+
+"""
+
+# import useful modules
+import argparse
+import glob
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from scoringCache import ScoringCache
+from multiScoring import batchMultiPatternDetect
+from trialStore import TrialStore
+
+measures = ['speed', 'errors', 'accuracy']
+summaryMeasures = measures + ['intrusions']
+taskSequences = ['41324', '23142', '32413']  # the two learned sequences and the practice sequence
+
+# A routine to find the participant data files (P<participant>.csv) in a directory
+def findDataFiles(dataDir):
+    fileNames = glob.glob(os.path.join(dataDir, 'P*.csv'))
+    return sorted(fileName for fileName in fileNames if re.match(r'P\d+\.csv$', os.path.basename(fileName)))
+
+# A routine to load a participant's data, from the binary store if there is one, otherwise from the csv file
+# the csv file is used if it is newer than the store (e.g. the store could not be saved at the end of the last session)
+def loadStore(fileName):
+    header = os.path.join(os.path.splitext(fileName)[0] + '_store', 'header.json')
+    if os.path.exists(header) and not (os.path.exists(fileName) and
+                                       os.path.getmtime(fileName) > os.path.getmtime(header)):
+        return TrialStore.load(os.path.dirname(header))
+    return TrialStore.fromCsv(fileName)
+
+# A routine to re-score every trial in a store, one batch per target sequence (through cache if given), counting
+# intrusions (occurrences of the other task sequences in each stream) in the same pass
+# returns a DataFrame with one row per trial
+def rescoreStore(store, cache=None):
+    trials = pd.DataFrame(dict((name, store.column(name)) for name in
+                               ['participant', 'session', 'targetSequence', 'sequenceType', 'trial']))
+    for name in ['participant', 'session', 'targetSequence']:  # same types whether loaded from csv or binary
+        trials[name] = trials[name].astype(str)
+    for measure in summaryMeasures:
+        trials[measure] = np.nan
+    streams = store.lists('stream')
+    for targetSequence in trials['targetSequence'].unique():
+        rows = np.nonzero((trials['targetSequence'] == targetSequence).values)[0]
+        otherSequences = [sequence for sequence in taskSequences if sequence != targetSequence]
+        if cache is None:
+            output = batchMultiPatternDetect([streams[row] for row in rows], targetSequence, otherSequences)
+        else:
+            output = cache.score([streams[row] for row in rows], targetSequence, otherSequences)
+        for measure in summaryMeasures:
+            trials.loc[trials.index[rows], measure] = output[measure]
+    return trials
+
+# each worker process keeps its scoring cache open between participants
+workerCaches = {}
+
+# worker routine: load and re-score one participant data file, using the scoring cache in cacheFile if given
+# returns the re-scored trials and the cache hit/miss counts for this file
+def scoreParticipant(fileName, cacheFile=None):
+    if cacheFile is None:
+        return rescoreStore(loadStore(fileName)), {}
+    if cacheFile not in workerCaches:
+        workerCaches[cacheFile] = ScoringCache(cacheFile)
+    cache = workerCaches[cacheFile]
+    before = cache.counts()
+    trials = rescoreStore(loadStore(fileName), cache)
+    return trials, dict((name, count - before[name]) for name, count in cache.counts().items())
+
+# A routine to summarise re-scored trials (mean speed, errors, accuracy and intrusions) per participant, session and
+# sequence type, adding the session 3 old vs. new contrast (old minus new, sessionType '3' and sequenceType 'old-new')
+# for each participant
+def summarise(trials):
+    summary = trials.groupby(['participant', 'session', 'sequenceType'])[summaryMeasures].mean()
+    summary['trials'] = trials.groupby(['participant', 'session', 'sequenceType']).size()
+    summary = summary.reset_index()
+
+    session3 = trials[trials['session'].str.startswith('3')]
+    if len(session3) == 0:  # no participant has reached session 3 yet, so there is no contrast to add
+        summary = summary.sort_values(['participant', 'session', 'sequenceType']).reset_index(drop=True)
+        return summary[['participant', 'session', 'sequenceType', 'trials'] + summaryMeasures]
+    means = session3.groupby(['participant', 'sequenceType'])[summaryMeasures].mean().unstack('sequenceType')
+    contrast = pd.DataFrame(index=means.index)
+    for measure in summaryMeasures:
+        if ('old' in means[measure].columns) and ('new' in means[measure].columns):
+            contrast[measure] = means[measure]['old'] - means[measure]['new']
+        else:
+            contrast[measure] = np.nan
+    contrast['trials'] = session3.groupby('participant').size()
+    contrast = contrast.reset_index()
+    contrast['session'] = '3'
+    contrast['sequenceType'] = 'old-new'
+
+    summary = pd.concat([summary, contrast], ignore_index=True)
+    summary = summary.sort_values(['participant', 'session', 'sequenceType']).reset_index(drop=True)
+    return summary[['participant', 'session', 'sequenceType', 'trials'] + summaryMeasures]
+
+# A routine to re-score and summarise every participant in a data directory, writing one summary file
+# cacheFile is the scoring cache to use (None to score every trial)
+def analyseCohort(dataDir, output, workers=None, cacheFile=None):
+    startTime = time.time()
+    fileNames = findDataFiles(dataDir)
+    print('Found %i participant data files in %s' % (len(fileNames), dataDir))
+    if cacheFile is not None:
+        ScoringCache(cacheFile).close()  # create the cache (and drop out of date scores) before the workers start
+    results = []
+    cacheCounts = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = dict((executor.submit(scoreParticipant, fileName, cacheFile), fileName) for fileName in fileNames)
+        for n, future in enumerate(as_completed(futures)):
+            trials, counts = future.result()
+            results.append(trials)
+            for name, count in counts.items():
+                cacheCounts[name] = cacheCounts.get(name, 0) + count
+            print('[%i/%i] %s: %i trials (%.1f seconds)' % (n + 1, len(fileNames), futures[future],
+                                                              len(trials), time.time() - startTime))
+    if not results:
+        return None
+    trials = pd.concat(results, ignore_index=True)
+    summary = summarise(trials)
+    summary.to_csv(output, index=False)
+    print('Scored %i trials from %i participants in %.1f seconds, summary saved to %s' % (
+        len(trials), len(fileNames), time.time() - startTime, output))
+    if cacheCounts:
+        print('Scoring cache: %(memoryHits)i memory hits, %(diskHits)i disk hits, %(misses)i scored' % cacheCounts)
+    return summary
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Re-score and summarise every participant in the data directory')
+    parser.add_argument('--dataDir', default='data', help='directory holding the P<participant>.csv files')
+    parser.add_argument('--output', default=os.path.join('data', 'cohortSummary.csv'), help='summary file to write')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: all cores)')
+    parser.add_argument('--cache', default=None,
+                        help='scoring cache file (default: scoringCache.sqlite in the data directory)')
+    parser.add_argument('--noCache', action='store_true', help='score every trial without using the cache')
+    args = parser.parse_args()
+    cacheFile = None if args.noCache else (args.cache or os.path.join(args.dataDir, 'scoringCache.sqlite'))
+    analyseCohort(args.dataDir, args.output, args.workers, cacheFile)
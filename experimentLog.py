@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Title: Buffered log file for the finger tapping task
+Keeps the log file open for the whole experiment and holds new lines in memory until a safe point (e.g. a rest block)
+or, optionally, a background thread writes them out, so logging never waits on the disk during the task.
+
+"""
+
+# import useful modules
+import atexit
+import os
+import threading
+
+# A log file that stays open and buffers writes
+class ExperimentLog(object):
+
+    def __init__(self, logFile, clock, flushInterval=None):
+        self.logFile = logFile
+        self.clock = clock  # timestamps come from this clock's getTime()
+        self.lines = []  # lines waiting to be written
+        self.lock = threading.Lock()  # the background thread and the experiment both use the buffer
+        self.fileLock = threading.Lock()  # only one flush writes to the file at a time
+        self.file = open(logFile, 'a')  # open our log file in append mode so don't overwrite with each new log
+        self.closed = False
+        atexit.register(self.close)  # whatever happens, write out the buffer when python exits
+        if flushInterval is not None:  # write the buffer out every flushInterval seconds in the background
+            self.stopFlushing = threading.Event()
+            self.flusher = threading.Thread(target=self.flushEvery, args=(flushInterval,))
+            self.flusher.daemon = True  # don't keep python running for the flusher
+            self.flusher.start()
+
+    # A routine to add a message to the log
+    def write(self, logString, timeStamp=1):
+        if timeStamp != 0:  # if timestamp has not been turned off
+            logString += '// logged at %.3fseconds' % self.clock.getTime()  # write a timestamp (millisecond resolution)
+        with self.lock:
+            self.lines.append(logString + '\n')
+
+    # A routine to write out any buffered lines and make sure they reach the disk
+    def flush(self):
+        with self.lock:  # take the waiting lines, so new lines can be logged while these are written
+            lines, self.lines = self.lines, []
+        with self.fileLock:
+            if self.closed or not lines:
+                return
+            self.file.write(''.join(lines))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    # background thread routine
+    def flushEvery(self, flushInterval):
+        while not self.stopFlushing.wait(flushInterval):
+            self.flush()
+
+    # A routine to write out the buffer and close the file (safe to call more than once)
+    def close(self):
+        if self.closed:
+            return
+        if hasattr(self, 'stopFlushing'):
+            self.stopFlushing.set()
+        self.flush()
+        with self.fileLock:
+            self.file.close()
+            self.closed = True
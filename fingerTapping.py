@@ -7,40 +7,81 @@ Last edit date: 14/04/2014
 
 """
 
-# import useful modules
+# import useful modules (only what is needed for the dialogs, the rest is imported in the background below)
 import time
-import pandas as pd
+startupTimes = [('launch', time.time())]  # time at the end of each startup step, for the startup log
 import numpy as np
 import sys
 import os
-from psychopy import visual, event, core, gui, data
-from pyglet.window import key
-from num2words import num2words
+import threading
+from psychopy import core, gui
+from scoring import SequenceDetector
+from experimentLog import ExperimentLog
+from trialStore import TrialStore
+from trialRecords import appendRecord, writeRecords, compactRecords, sessionProgress, sessionTrials, discardRecords
+from stationIndex import SessionIndex, SessionClaimed
 
 os.chdir(os.path.abspath(''))  # change working directory to script directory
 globalClock = core.Clock()  # create timer to track the time since experiment started
+startupTimes.append(('dialog imports', time.time()))
+
+# modules that are slow to import and not needed until the dialogs are done are imported (and the countdown labels
+# built) in the background while the dialogs are open. Only modules that do not touch the display go here: importing
+# psychopy.visual or pyglet.window creates an OpenGL context, which has to happen on the main thread
+def importTaskModules():
+    global data, num2words, timerLabels
+    try:
+        from psychopy import data
+        from num2words import num2words
+        import pandas  # loaded now so reading and writing csv files later does not have to wait for it
+        timerLabels = dict((count, num2words(count)) for count in range(0, 31))  # countdown labels 'zero' to 'thirty'
+        timerLabels['tap'] = 'Tap as fast as you can!'
+    except Exception as error:  # hand the error to the main thread, which raises it in waitForTaskModules
+        importErrors.append(error)
+    taskModulesReady.append(time.time())
+
+importErrors = []
+taskModulesReady = []  # gets the time the background imports finished
+taskModules = threading.Thread(target=importTaskModules)
+taskModules.daemon = True  # don't keep python running if the user quits at a dialog
+taskModules.start()
+
+# A routine to wait for the background imports to finish
+def waitForTaskModules():
+    taskModules.join()
+    if importErrors:
+        raise importErrors[0]
+
+# A routine to import the window, stimulus and key handling modules, on the main thread once the dialogs are done
+def importDisplayModules():
+    global visual, event, key, KeyCapture, StimulusCache, FrameTimer, MarkerArray, addKeys
+    from psychopy import visual, event
+    from pyglet.window import key
+    from keyCapture import KeyCapture
+    from stimulusCache import StimulusCache
+    from frameTiming import FrameTimer
+    from markerArray import MarkerArray, addKeys
 
 ### set up some useful routines ###
 
 # A routine to save messages to a log file recording everything the exp is doing
+# messages are buffered and written to disk at safe points (rest blocks, quitting) by calling log.flush()
 def saveToLog(logString, timeStamp=1):
-    f = open(logFile, 'a')  # open our log file in append mode so don't overwrite with each new log
-    f.write(logString)  # write the string they typed
-    if timeStamp != 0:  # if timestamp has not been turned off
-        f.write('// logged at %iseconds' % globalClock.getTime())  # write a timestamp (very coarse)
-    f.write('\n')  # create new line
-    f.close()  # close and "save" the log file
+    log.write(logString, timeStamp)  # add the message to the log (with a timestamp unless turned off)
 
 # An exit routine to initiate if escape is pressed
 def quitExp():
-    if 'logFile' in globals():  # if a log file has been created
+    if 'log' in globals():  # if a log file has been created
         saveToLog('User aborted experiment')
+        log.close()  # write out everything logged and close the log file
+    if 'index' in globals():  # if a session has been claimed in the shared index
+        index.release()  # let other stations run this participant
     if 'win' in globals():  # if a window has been created
         win.close()  # close the window
     core.quit()  # quit the program
 
 # Finger tapping task routine
-def fingerTapping(trials, targetSequence, store, sequenceType, sessionType):
+def fingerTapping(trials, targetSequence, store, sequenceType, sessionType, firstTrial=1):
     ## Intro screen ##
     saveToLog('Presenting introduction screen') # save info to log
     win.setColor('#000000')  # set background colour to black
@@ -53,7 +94,7 @@ def fingerTapping(trials, targetSequence, store, sequenceType, sessionType):
     event.clearEvents()  # clear the event buffer
 
     win.flip()  # blank the screen first
-    trials = range(1, trials + 1)
+    trials = range(firstTrial, firstTrial + trials)  # trial numbers (a resumed session carries on from firstTrial)
     saveToLog('Running finger tapping task. %i trials with target sequence %s' % (
         len(trials), targetSequence))  # save info to log
 
@@ -62,18 +103,19 @@ def fingerTapping(trials, targetSequence, store, sequenceType, sessionType):
         # begin rest block
         win.setColor('#ff0000')  # set background colour to red
         win.flip()  # display
-        if thisTrial == 1:  # if this is first trial
+        if thisTrial == firstTrial:  # if this is first trial
             restClock = core.CountdownTimer(10) # start timer counting down from 10
         else:  # for all other trials
             saveToLog('Resting')  # save info to log
+            log.flush()  # the rest block is a safe point to write the log to disk
             restClock = core.CountdownTimer(30)  # start timer counting down from 30
         sequenceText.setText(targetSequence)  # set up sequence text
         sequenceText.setAutoDraw(True)  # display sequence text continuously
-        timerText.setAutoDraw(True)  #  display timer text continuously
+        timerText.show(int(np.ceil(restClock.getTime())))  # display timer text continuously
         win.flip()  # display
         while restClock.getTime() > 0:  # loop continues until trial timer ends
             count = restClock.getTime()  # get current time from clock
-            timerText.setText(num2words(np.ceil(count)))  # set timer text to the current time
+            timerText.show(int(np.ceil(count)))  # show the current time (only changes once a second)
             win.flip()  # display
             if event.getKeys(['escape']):  # checks for the key 'escape' on every refresh so user can quit at any point
                 quitExp()  # initiate quit routine
@@ -82,86 +124,36 @@ def fingerTapping(trials, targetSequence, store, sequenceType, sessionType):
         saveToLog('Trial: %i' % thisTrial) # save info to log
         win.setColor('#89ba00')  # set background colour to green
         win.flip()  # display
-        stream = []  # clear any existing response stream info
+        detector = SequenceDetector(targetSequence)  # score the stream as it comes in
         event.clearEvents()  # this makes sure the key buffer is cleared, otherwise old key presses might be recorded
+        capture.reset()  # start recording key presses for this trial (timestamps are from now)
+        frameTimer.reset()  # start recording frame timing for this trial
+        markers.show()  # draw the markers (all off to begin with)
         trialClock = core.CountdownTimer(30)  # start timer counting down from 30
-        timerText.setText('Tap as fast as you can!')  # set timer text to the current time
+        timerText.show('tap')  # change timer text to the tapping instruction
         win.flip()  # display
 
-        k = 0  # set up marker index
-        endTrial = False  # a trigger to end the trial (deployed when the timer runs out)
-        while endTrial == False:  # while trigger has not been deployed
-            # display incremental markers across the screen from left to right as the user presses accepted keys
-            if k == 0:  # start at beginning of marker index
-                # start markers incrementing from left to right
-                while k < len(
-                        listOfMarkers) - 1 and endTrial == False:  # until the markers reach the far side of the screen
-                    if trialClock.getTime() <= 0:  # if timer has run out
-                        endTrial = True  # deploy the trigger to end the trial
-                        break  # and break out of this loop
-                    elif event.getKeys(['escape']):  # if user presses escape key
-                        quitExp()  # quit the program
-                    elif event.getKeys('1'):  # checks for key on every refresh
-                        listOfMarkers[k].setAutoDraw(True)  # turn this marker on
-                        win.flip()  # display
-                        stream.append(1)  # record the key press
-                        k += 1  # move on to the next marker
-                    elif event.getKeys('2'):  # checks for key on every refresh
-                        listOfMarkers[k].setAutoDraw(True)  # turn this marker on
-                        win.flip()  # display
-                        stream.append(2)  # record the key press
-                        k += 1  # move on to the next marker
-                    elif event.getKeys('3'):  # checks for key on every refresh
-                        listOfMarkers[k].setAutoDraw(True)  # turn this marker on
-                        win.flip()  # display
-                        stream.append(3)  # record the key press
-                        k += 1  # move on to the next marker
-                    elif event.getKeys('4'):  # checks for key on every refresh
-                        listOfMarkers[k].setAutoDraw(True)  # turn this marker on
-                        win.flip()  # display
-                        stream.append(4)  # record the key press
-                        k += 1  # move on to the next marker
-
-
-            elif k == len(listOfMarkers) - 1 and endTrial == False:
-                # start going down
-                while k > 0:
-                    if trialClock.getTime() <= 0:  # if timer has run out
-                        endTrial = True  # deploy the trigger to end the trial
-                        break  # and break out of this loop
-                    elif event.getKeys(['escape']):   # if user presses escape key
-                        quitExp()  # quit the program
-                    elif event.getKeys('1'):  # checks for key on every refresh
-                        listOfMarkers[k].setAutoDraw(False)  # turn this marker off
-                        win.flip()  # display contents of video buffer
-                        stream.append(1)  # record the key press
-                        k -= 1  # move on to the next marker
-                    elif event.getKeys('2'): #checks for key on every refresh
-                        listOfMarkers[k].setAutoDraw(False)  # turn this marker off
-                        win.flip()  # display contents of video buffer
-                        stream.append(2)  # record the key press
-                        k -= 1  # move on to the next marker
-                    elif event.getKeys('3'): #checks for key on every refresh
-                        listOfMarkers[k].setAutoDraw(False)  # turn this marker off
-                        win.flip()  # display contents of video buffer
-                        stream.append(3)  # record the key press
-                        k -= 1  # move on to the next marker
-                    elif event.getKeys('4'): #checks for key on every refresh
-                        listOfMarkers[k].setAutoDraw(False)  # turn this marker off
-                        win.flip()  # display contents of video buffer
-                        stream.append(4)  # record the key press
-                        k -= 1  # move on to the next marker
+        while trialClock.getTime() > 0:  # loop continues until trial timer ends
+            newKeys, newTimes = capture.newPresses()  # get any key presses since the last check, in order
+            if capture.escapePressed:  # if user presses escape key
+                quitExp()  # quit the program
+            # display incremental markers across the screen as the user presses accepted keys, and update the score
+            addKeys(newKeys, markers, detector)
+            if len(newKeys):  # if any markers changed
+                frameTimer.flip(newTimes + capture.startTime)  # display (timing the flip and the key presses shown)
+        stream, keyTimes = capture.recorded()  # get the response stream and the time of each key press
 
         # turn off all markers during the rest block
-        for marker in listOfMarkers:  # for each marker
-            marker.setAutoDraw(False)  # turn off
+        markers.hide()
 
         win.setColor('#ff0000')  # set background colour to red
         win.flip()  # display
 
         if not metaData['practice mode']:  # if it is not practice mode
 
-            output = patternDetect(stream, targetSequence)  # run the pattern detector to calculate speed and errors
+            output = detector.score()  # get speed and errors from the pattern detector (same as patternDetect)
+            if output['speed'] == 0:  # integrity check
+                print('Issue with this stream - speed is zero')
 
             #  gather all relevant data for this trial
             newRow = {'participant': participant,
@@ -170,112 +162,31 @@ def fingerTapping(trials, targetSequence, store, sequenceType, sessionType):
                       'sequenceType': sequenceType,
                       'trial': thisTrial,
                       'stream': stream,
+                      'keyTimes': np.round(keyTimes, 4),
                       'speed': output['speed'],
                       'errors': output['errors'],
                       'accuracy': output['accuracy']}
+            newRow.update(frameTimer.summary())  # add frame timing summary (nan if not recorded)
 
             # record data in store
-            store = store.append(newRow, ignore_index=True)
+            store.append(newRow)  # adds the row in place, without copying earlier trials
+            appendRecord(recordFile, newRow)  # and save it to disk straight away
+            index.update(len(store) + sum(trialsDone.values()), sessionType)  # show progress to the other stations
 
     sequenceText.setAutoDraw(False)  # turn off the sequence text
-    timerText.setAutoDraw(False)  # turn off the timer text
+    timerText.hide()  # turn off the timer text
     win.flip()  # display
 
     return store
 
-# Routine for analysing the response stream
-def patternDetect(stream, targetSequence):
-    # pre-load some variables
-    targetSequence = map(int, list(targetSequence))
-    stream = list(stream)
-    speed = float(0) # store for complete sequences(i.e. speed)
-    contiguousError = 0 # store for contiguous incorrect items
-    errors = float(0) # store for errors
-    i = 0  # start at position 1
-
-    # start pattern detector
-
-    while i < len(stream):  # search through every item in stream
-
-        # for all expect final items (which are anything less than a whole sequence at the end of the stream)
-        if i <= len(stream) - len(targetSequence):
-
-            # if the next sequence length of items in the stream matches the target sequence
-            if stream[i:(i + len(targetSequence))] == targetSequence:
-
-                speed += 1  # record a pattern completed
-                i += len(targetSequence)  # adjust position to skip forward by length of targetSequence
-
-                # CHECK ERRORS need to reset contiguous error counter and add any accumulated errors to the total count
-                if contiguousError >= 1:  # check if there are contiguous errors we have not yet accounted for
-
-                    errors += 1 # add an error to the total count
-                    contiguousError = 0 # reset contiguous error count
-
-            # else if the next sequence length of items in the stream does not match the target sequence
-            elif stream[i:(i + len(targetSequence))] != targetSequence:
-
-                contiguousError += 1  # record a 'contiguous error'
-                i += 1  # adjust index forward by 1
-
-                # CHECK ERRORS when contiguous error count reaches 5 or if this is the final item of the stream
-                if contiguousError == 5 or i == len(stream):
-                    errors += 1 # add an error to the total count
-                    contiguousError = 0 # reset contiguous error count
-        # now deal with last items of the stream (a special case, see 'method' above)
-        else:
-
-            # get last items
-            lastItems = stream[i:]
-
-            # get subset of target sequence of same length as last items
-            sequenceSubset = targetSequence[:len(lastItems)]
-
-            while lastItems != None:  # while there are additional items left to check
-
-                if lastItems == sequenceSubset:  # if lastItems match target sequence subset
-
-                    speed += float(len(lastItems)) / float(len(targetSequence))  # record fractional sequence
-
-                    if contiguousError >= 1:  # check if there are errors we have not yet recorded
-
-                        errors += 1  # add an error to total
-
-                        contiguousError = 0  # reset contiguous error count
-
-                    lastItems = None  # force failure of inner while loop by updating lastItems
-
-                    i = len(stream)  # force failure of outer while loop by updating i
-
-                else:  # if lastItems do not match target sequence
-
-                    contiguousError += 1  # add 1 to contiguous error count
-
-                    # when contiguous error count reaches 5 or if this is final item
-                    if contiguousError == 5 or len(lastItems) == 1:
-                        errors += 1  # add an error to total
-                        contiguousError = 0  # reset contiguous error count
-
-                    if len(lastItems) == 1:  # if this is the final item
-
-                        lastItems = None  # force failure of inner while loop by updating lastItems
-
-                        i = len(stream)  # force failure of outer while loop by updating i
-
-                    else:  # else if there are still items left to check
-
-                        lastItems = lastItems[1:]  # drop the first item from lastItems
-
-                        sequenceSubset = sequenceSubset[:-1]  # drop the last item from the sequence subset
-
-    # integrity check
-    if speed == 0:
-        print('Issue with this stream - speed is zero')
-        accuracy = float('nan')
-    else:
-        accuracy = 1 - errors / speed  # calculate accuracy
-
-    return {'speed': speed, 'errors': errors, 'accuracy': accuracy}
+# A routine to run the trials of one part of a session that have not been recorded yet (all of them, unless an
+# incomplete session is being resumed)
+def runTrials(trials, targetSequence, store, sequenceType, sessionType):
+    done = trialsDone.get(sessionType, 0)  # trials already recorded for this part
+    if done >= trials:
+        return store
+    return fingerTapping(trials - done, targetSequence, store=store, sequenceType=sequenceType,
+                         sessionType=sessionType, firstTrial=done + 1)
 
 ### Collect and store meta-data about the experiment session ###
 expName = 'Sequence learning task'  # define experiment name
@@ -283,11 +194,12 @@ date = time.strftime("%d %b %Y %H:%M:%S", time.localtime())  # get date and time
 metaData = {'participant': '',
             'practice mode': False,
             'override automated counter-balancing': False,
+            'record frame timing': False,
             'researcher': 'TH',
             'location': '204F, UCL, London'}  # set up info for infoBox gui
 infoBox = gui.DlgFromDict(dictionary=metaData,
                           title=expName,
-                          order=['participant', 'practice mode','override automated counter-balancing'])  # display gui to get info from user
+                          order=['participant', 'practice mode','override automated counter-balancing', 'record frame timing'])  # display gui to get info from user
 if not infoBox.OK:  # if user hit cancel
     quitExp()  # quit
 
@@ -297,17 +209,36 @@ if not infoBox.OK:  # if user hit cancel
 if not metaData['practice mode']:  # if this is not practice mode:
     participant = metaData['participant']
     fileName = 'data' + os.path.sep + 'P%s.csv' % (participant)  # build filename for this participant's data
+    recordFile = 'data' + os.path.sep + 'P%s_records.jsonl' % (participant)  # every trial is appended here as it ends
+    storeDirectory = 'data' + os.path.sep + 'P%s_store' % (participant)  # binary copy of the data file
+    store = TrialStore()  # set up a store for this session's data
+    index = SessionIndex('data')  # index of the sessions running on every station sharing the data directory
+
+    # claim the participant in the shared index, so no other station can run them at the same time
+    try:
+        index.claim(participant)
+    except SessionClaimed as claimed:
+        myDlg = gui.Dlg()
+        myDlg.addText(
+            "%s. Please check the participant number. Click ok to take over this participant (only if that station has crashed) or cancel to abort." % claimed)
+        myDlg.show()  # show dialog and wait for OK or Cancel
+        if not myDlg.OK:  # if the user pressed cancel
+            quitExp()
+        index.claim(participant, force=True)
 
     # is this an existing participant? If so we will read in their existing files and identify the next session
-    if os.path.exists(fileName):  # if existing participant, read in existing store
+    session, trialsDone = 1, {}  # designate as first session, with no trials done yet
+    if os.path.exists(fileName) or os.path.exists(recordFile):
+        if not os.path.exists(recordFile):  # data saved before trial records were kept
+            writeRecords(recordFile, TrialStore.fromCsv(fileName))  # start the record file from the existing data
 
-        store = pd.read_csv(fileName,
-                            usecols=['participant', 'session', 'targetSequence', 'sequenceType', 'trial', 'stream',
-                                     'speed',
-                                     'errors', 'accuracy'])
+        # get the next session, or the last one again if it was not completed (trialsDone has what it has so far)
+        session, trialsDone = sessionProgress(recordFile)
+    existingParticipant = session > 1 or len(trialsDone) > 0
+    incompleteSession = len(trialsDone) > 0
+    index.start(session)  # show the other stations which session is being run
 
-        # get last session and increment by one
-        session = int(store['session'].irow(-1)[0]) + 1
+    if existingParticipant:  # if existing participant
 
         # check user knows this is an existing participant
         myDlg = gui.Dlg()
@@ -324,15 +255,18 @@ if not metaData['practice mode']:  # if this is not practice mode:
             if not myDlg.OK:  # if the user pressed cancel
                 quitExp()
 
-    else:  # if this is a new participant set up new store
-
-        # set up a new data store
-        store = pd.DataFrame(
-            columns=['participant', 'session', 'targetSequence', 'sequenceType', 'trial', 'stream', 'speed', 'errors',
-                     'accuracy'])
+        if incompleteSession:  # the last session was stopped part way - carry on from where it stopped or start again
+            myDlg = gui.Dlg()
+            myDlg.addText(
+                "Session %i was not completed (%i of %i trials recorded). Click ok to resume it from the next trial or cancel to restart it from the beginning." % (
+                    session, sum(trialsDone.values()),
+                    sum(total for sessionType, total in sessionTrials.items() if int(sessionType[0]) == session)))
+            myDlg.show()  # show dialog and wait for OK or Cancel
+            if not myDlg.OK:  # if the user pressed cancel, keep the earlier trials aside and run the whole session
+                discardRecords(recordFile, session, 'data' + os.path.sep + 'P%s_discarded.jsonl' % (participant))
+                trialsDone = {}
 
-        # designate as first session
-        session = 1
+    else:  # if this is a new participant
 
         # collect some demographic details about the user
 
@@ -341,6 +275,7 @@ if not metaData['practice mode']:  # if this is not practice mode:
         if infoBox.OK:  # this will be True (user hit OK) or False (cancelled)
             metaData.update(metaData2) # add new metaData to existing metaData
         else:
+            index.release()  # let other stations run this participant
             sys.exit("User cancelled gui.")
 
     # set up counterbalancing
@@ -353,6 +288,7 @@ if not metaData['practice mode']:  # if this is not practice mode:
         if not infoBox.OK:  # if user hit cancel
             quitExp()  # quit
     else:  # otherwise use automated counter-balancing
+        waitForTaskModules()  # psychopy.data is imported in the background
         trialList = data.createFactorialTrialList(
             {'sequenceOrder': ['X', 'Y'], 'testOrder': ['A', 'B']}) # get counter balancing conditions
         # assign to counter-balanced conditions [the 4 unique arrangements are assigned cyclically]
@@ -372,6 +308,10 @@ if not metaData['practice mode']:  # if this is not practice mode:
 
     # set up filename for saving log, each P and S saved as separate file
     logFile = 'data' + os.path.sep + 'P' + str(metaData['participant']) + 'S' + str(metaData['session']) + '_log.txt'
+    attempt = 1
+    while incompleteSession and os.path.exists(logFile):  # running an incomplete session again gets a new log file
+        attempt += 1
+        logFile = 'data' + os.path.sep + 'P%sS%s_log%i.txt' % (metaData['participant'], metaData['session'], attempt)
 
     # check if a previous log exists with this name and if it does ask user to resolve before continuing
     while os.path.exists(logFile):
@@ -383,45 +323,67 @@ if not metaData['practice mode']:  # if this is not practice mode:
             quitExp()
 
 
+    log = ExperimentLog(logFile, clock=globalClock)  # open the log file
+
     # save metaData to log
     saveToLog('experiment: %s' % (metaData['expName']), 0)
     saveToLog('researcher: %s' % (metaData['researcher']), 0)
     saveToLog('location: %s' % (metaData['location']), 0)
     saveToLog('date: %s' % (metaData['date']), 0)
     saveToLog('participant: %s' % (metaData['participant']), 0)
-    if session==1:
+    saveToLog('station: %s' % (index.station), 0)
+    if 'gender' in metaData:  # demographics are only collected for new participants
         saveToLog('gender: %s' % (metaData['gender']), 0)
         saveToLog('age: %s' % (metaData['age']), 0)
     saveToLog('session: %s' % (metaData['session']), 0)
     saveToLog('sequence Order:%s' % (metaData['sequenceOrder']), 0)
     saveToLog('testOrder: %s' % (metaData['testOrder']), 0)
+    saveToLog('record frame timing: %s' % (metaData['record frame timing']), 0)
     saveToLog('..........................................', 0)
 else:  # if it is practice mode
     # set up practice log file
     logFile = 'data' + os.path.sep + 'practice_log.txt'
+    log = ExperimentLog(logFile, clock=globalClock)  # open the log file
 
 ### Prepare stimuli etc ###
+startupTimes.append(('dialogs and participant files', time.time()))
+waitForTaskModules()
+startupTimes.append(('waiting for background imports', time.time()))
+importDisplayModules()
+startupTimes.append(('window and key handling imports', time.time()))
 win = visual.Window(size=(1280, 1024), fullscr=True, screen=0, allowGUI=False, allowStencil=False,
                     monitor='testMonitor', color='black', colorSpace='rgb', units='pix') # setup the Window
 generalText = visual.TextStim(win=win, ori=0, name='generalText', text='', font=u'Arial', pos=[0, 0], height=35,
                               wrapWidth=920, color=u'white', colorSpace=u'rgb', opacity=1, depth=0.0)  # general text
 sequenceText = visual.TextStim(win=win, ori=0, name='sequenceText', text='', font=u'Arial', pos=[0, 250], height=90,
                                wrapWidth=None, color=u'white', colorSpace=u'rgb', opacity=1, depth=0.0)  # sequence text
-timerText = visual.TextStim(win=win, ori=0, name='sequenceText', text='', font=u'Arial', pos=[0, -130], height=40,
-                            wrapWidth=800, color=u'white', colorSpace=u'rgb', opacity=1, depth=0.0)  # timer text
 
-# set up the markers that increment across the screen - generate enough so that they cover the full range of the window
-listOfMarkers = []  # store for white markers
-windowSize = list(win.size) # get window size
-for i in range(-windowSize[0] / 2, windowSize[0] / 2, windowSize[0] / 40):  # generate markers to cover whole screen
-    i += 25  # add a slight horizontal adjustment to ensure markers do not go off screen
-    listOfMarkers.append(visual.Circle(win, radius=15, edges=32, pos=[i, 0], fillColor='white'))  # generate the markers
+# timer text - every label it can show is built once here, the countdown just swaps between them
+def makeTimerText(text):
+    return visual.TextStim(win=win, ori=0, name='timerText', text=text, font=u'Arial', pos=[0, -130], height=40,
+                           wrapWidth=800, color=u'white', colorSpace=u'rgb', opacity=1, depth=0.0)
+timerText = StimulusCache(makeTimerText, timerLabels)
+
+# set up the markers that increment across the screen - enough to cover the full range of the window, drawn together
+markers = MarkerArray(win)
 
 # for monitoring key state (only need this if using markers)
 keys = key.KeyStateHandler()
 win.winHandle.push_handlers(keys)
+capture = KeyCapture(win.winHandle, clock=globalClock)  # records every key press in order with a timestamp
+
+# for timing the flips of the tapping loop (only if chosen in the set up dialog)
+frameTimer = FrameTimer(win, clock=globalClock, framePeriod=win.monitorFramePeriod,
+                        enabled=metaData['record frame timing'])
+
+startupTimes.append(('window and stimuli', time.time()))
 
 saveToLog('Set up complete') # save info to log
+# record how long each startup step took, so slow startups can be spotted
+saveToLog('startup: background imports finished %.3f seconds after launch' % (taskModulesReady[0] - startupTimes[0][1]), 0)
+for (previousStep, previousTime), (step, stepTime) in zip(startupTimes[:-1], startupTimes[1:]):
+    saveToLog('startup: %s took %.3f seconds' % (step, stepTime - previousTime), 0)
+log.flush()  # write the set up info to disk before the task starts
 ### set-up complete ###
 
 ### run the experiment ###
@@ -431,28 +393,28 @@ if metaData['practice mode']:  # if user has chosen practice mode
     fingerTapping(1, practiceSequence, store=[], sequenceType=[], sessionType ='1a')  # run 1 trial of the task with a practice sequence
 
 elif session == 1:
-    store = fingerTapping(12, oldSequence, store=store,
-                          sequenceType='old', sessionType = '1a')  # run 12 trials of the task with the old sequence
+    store = runTrials(12, oldSequence, store=store,
+                      sequenceType='old', sessionType = '1a')  # run 12 trials of the task with the old sequence
 
 elif session == 2:
-    store = fingerTapping(3, oldSequence, store=store,
-                          sequenceType='old', sessionType = '2a')  # run 3 trials of the task with the old sequence
-    store = fingerTapping(12, newSequence, store=store,
-                          sequenceType='new', sessionType = '2b')  # run 12 trials of the task with the new sequence
+    store = runTrials(3, oldSequence, store=store,
+                      sequenceType='old', sessionType = '2a')  # run 3 trials of the task with the old sequence
+    store = runTrials(12, newSequence, store=store,
+                      sequenceType='new', sessionType = '2b')  # run 12 trials of the task with the new sequence
 
 elif session == 3:
     if testOrder == 'A':
-        store = fingerTapping(3, oldSequence, store=store,
-                              sequenceType='old', sessionType = '3a')  # run 3 trials of the task with the old sequence
-        store = fingerTapping(3, newSequence, store=store,
-                              sequenceType='new', sessionType = '3b')  # run 3 trials of the task with the new sequence
+        store = runTrials(3, oldSequence, store=store,
+                          sequenceType='old', sessionType = '3a')  # run 3 trials of the task with the old sequence
+        store = runTrials(3, newSequence, store=store,
+                          sequenceType='new', sessionType = '3b')  # run 3 trials of the task with the new sequence
 
     elif testOrder == 'B':
-        store = fingerTapping(3, newSequence, store=store,
-                              sequenceType='new', sessionType = '3a')  # run 3 trials of the task with the new sequence
+        store = runTrials(3, newSequence, store=store,
+                          sequenceType='new', sessionType = '3a')  # run 3 trials of the task with the new sequence
 
-        store = fingerTapping(3, oldSequence, store=store,
-                              sequenceType='old', sessionType = '3b')  # run 3 trials of the task with the old sequence
+        store = runTrials(3, oldSequence, store=store,
+                          sequenceType='old', sessionType = '3b')  # run 3 trials of the task with the old sequence
 
 ## End screen ##
 saveToLog('Presenting end screen')  # save info to log
@@ -474,13 +436,14 @@ if metaData['practice mode']:  # if user has chosen practice mode
 
 win.close()
 
-# save the data as a csv file
+# save the data as a csv file, built from the trial records (which already hold every trial of every session)
 # the loop below also checks if saving is not possible, usually because the file is already open, and asks user to close if this is the case
 # if this does not resolve the situation, attempt is made to save the data with a different filename
 while True:
     try:
-        store.to_csv(fileName)
+        allTrials = compactRecords(recordFile, fileName)
         saveToLog('Data saved with file name: %s' % fileName) # save info to log
+        allTrials.save(storeDirectory)  # also save in binary form, for fast loading in analysis
         break
     except: # if cannot save data, likely because file is already open, ask user to close
         saveToLog('Problem encountered saving data - requesting user close open data files...') # save info to log
@@ -492,16 +455,18 @@ while True:
             fileName = 'data' + os.path.sep + 'P%s_problemSaving.csv' % (participant)  # build filename for this participant's data
             saveToLog('Attempting to save data with different filename: %s' %fileName) # save info to log
             try:
-                store.to_csv(fileName)
+                compactRecords(recordFile, fileName)
                 print('Data was saved with a different filename: %s' %fileName)
                 saveToLog('Data saved with file name: %s' % fileName) # save info to log
                 break
             except:
                 saveToLog('Major error: Data could not be saved') # save info to log
                 quitExp() # quit the experiment
+index.finish()  # the session is complete and saved
 
 t = globalClock.getTime() # get run time of experiment
 saveToLog('Total experiment runtime was %i seconds' % t) # record runtime to log
+log.close()  # write out everything logged and close the log file
 
 # Shut down:
 core.quit()
\ No newline at end of file
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Title: Frame timing instrumentation for the finger tapping task
+Times every win.flip() of a trial, counts frames dropped because a flip took longer than a screen refresh, and records
+for each key press the time from when it was dispatched to the task to the end of the flip that displays it. Values go
+into preallocated arrays and are summarised per trial, for qualifying lab machines and spotting timing problems under
+load.
+
+The dispatch to flip time is not the full key press to display latency. Key presses are timestamped by KeyCapture when
+the window's event queue is dispatched in the trial loop, not when the key reached the computer, so it leaves out:
+- the keyboard's own scanning and USB polling delay
+- the time the press waited in the operating system's and pyglet's queues until the next dispatch, up to one flip when
+  the loop is blocked in a flip
+- the display's delay after the flip returns (scan-out to the marker's position on screen and the panel's response)
+It does cover the task's own share - drawing the markers and waiting for the flip - which is what load slows down.
+
+"""
+
+# import useful modules
+import numpy as np
+
+# names of the per-trial summary values, as saved with the trial data
+summaryColumns = ['flips', 'flipMean', 'flipMax', 'droppedFrames', 'dispatchToFlipMean', 'dispatchToFlipMax']
+
+# A stand-in for win.flip() that times each flip
+class FrameTimer(object):
+
+    # framePeriod is the duration of one screen refresh in seconds; if enabled is False flips are not timed
+    def __init__(self, win, clock, framePeriod=1.0 / 60, enabled=True, bufferSize=4096):
+        self.win = win
+        self.clock = clock
+        self.framePeriod = framePeriod
+        self.enabled = enabled
+        self.flipDurations = np.zeros(bufferSize)  # preallocated store for flip durations (seconds)
+        self.dispatchToFlip = np.zeros(bufferSize)  # preallocated store for key dispatch to flip end times (seconds)
+        self.reset()
+
+    # A routine to start a new trial's measurements
+    def reset(self):
+        self.nFlips = 0
+        self.nDispatched = 0
+
+    # A routine to flip the window, timing the flip. keyTimes are the clock times at which the key presses shown by this
+    # flip were dispatched (KeyCapture's timestamps)
+    def flip(self, keyTimes=()):
+        if not self.enabled:
+            self.win.flip()
+            return
+        start = self.clock.getTime()
+        self.win.flip()
+        end = self.clock.getTime()
+        if self.nFlips == len(self.flipDurations):  # buffer is full, double its size
+            self.flipDurations = np.append(self.flipDurations, np.zeros(len(self.flipDurations)))
+        self.flipDurations[self.nFlips] = end - start
+        self.nFlips += 1
+        if len(keyTimes):
+            needed = self.nDispatched + len(keyTimes)
+            if needed > len(self.dispatchToFlip):  # buffer is full, at least double its size
+                self.dispatchToFlip = np.append(self.dispatchToFlip, np.zeros(max(needed, len(self.dispatchToFlip))))
+            self.dispatchToFlip[self.nDispatched:needed] = end - np.asarray(keyTimes)
+            self.nDispatched = needed
+
+    # A routine to summarise the trial's measurements (all nan if timing is turned off)
+    def summary(self):
+        if not self.enabled:
+            return dict((name, float('nan')) for name in summaryColumns)
+        durations = self.flipDurations[:self.nFlips]
+        delays = self.dispatchToFlip[:self.nDispatched]
+        # a flip waits for the next refresh, so one lasting more than 1.5 refreshes has missed at least one
+        missed = np.round(durations / self.framePeriod) - 1
+        return {'flips': float(self.nFlips),
+                'flipMean': float(durations.mean()) if self.nFlips else float('nan'),
+                'flipMax': float(durations.max()) if self.nFlips else float('nan'),
+                'droppedFrames': float(missed[missed > 0].sum()),
+                'dispatchToFlipMean': float(delays.mean()) if self.nDispatched else float('nan'),
+                'dispatchToFlipMax': float(delays.max()) if self.nDispatched else float('nan')}
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Title: Event-driven key capture for the finger tapping task
+Records every accepted key press in the order it arrives, with a high-resolution timestamp, using a pyglet key
+handler pushed onto the window. Replaces polling event.getKeys once per key on every refresh, which loses the order of
+presses landing between two polls and does not timestamp them. The timestamp is taken when the press is dispatched to
+the handler (by newPresses), so it can be later than the press itself by however long the press waited in the window's
+queue.
+
+"""
+
+# import useful modules
+import timeit
+import numpy as np
+from pyglet.window import key
+
+# keys accepted as responses, and the code recorded in the stream for each
+responseKeys = {key._1: 1, key._2: 2, key._3: 3, key._4: 4}
+
+# A key press recorder to push onto a pyglet window (e.g. win.winHandle)
+class KeyCapture(object):
+
+    def __init__(self, winHandle, clock=None, bufferSize=2048):
+        self.winHandle = winHandle
+        if clock is None:  # if no clock given use the highest resolution timer available
+            self.getTime = timeit.default_timer
+        else:
+            self.getTime = clock.getTime
+        self.keys = np.zeros(bufferSize, dtype=np.int8)  # preallocated store for key codes
+        self.times = np.zeros(bufferSize)  # preallocated store for timestamps (seconds)
+        self.reset()
+        winHandle.push_handlers(self)  # receive key presses from the window
+
+    # A routine to empty the buffer, e.g. at the start of a trial. Timestamps are relative to the reset
+    def reset(self):
+        self.nPresses = 0  # number of presses recorded
+        self.nRead = 0  # number of presses already handed out by newPresses()
+        self.escapePressed = False
+        self.startTime = self.getTime()
+
+    # pyglet handler called for every key press - do as little as possible here
+    def on_key_press(self, symbol, modifiers):
+        if symbol == key.ESCAPE:
+            self.escapePressed = True
+        elif symbol in responseKeys:
+            if self.nPresses == len(self.keys):  # buffer is full, double its size rather than drop presses
+                self.keys = np.concatenate([self.keys, np.zeros_like(self.keys)])
+                self.times = np.concatenate([self.times, np.zeros_like(self.times)])
+            self.keys[self.nPresses] = responseKeys[symbol]
+            self.times[self.nPresses] = self.getTime() - self.startTime
+            self.nPresses += 1
+        # return nothing so the press is still passed on to the other handlers (e.g. psychopy's event module)
+
+    # A routine to collect any waiting key presses from the window and return the ones not handed out yet
+    # returns arrays of key codes and timestamps in the order the keys were pressed
+    def newPresses(self):
+        self.winHandle.dispatch_events()  # run the handlers for any presses waiting in the window's queue
+        start, self.nRead = self.nRead, self.nPresses
+        return self.keys[start:self.nRead], self.times[start:self.nRead]
+
+    # A routine to get all presses since the last reset as a list of key codes and an array of timestamps
+    def recorded(self):
+        return [int(thisKey) for thisKey in self.keys[:self.nPresses]], self.times[:self.nPresses].copy()
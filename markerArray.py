@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Title: Batched marker display for the finger tapping task
+All the markers that move across the screen are one ElementArrayStim, drawn in a single call. Turning a marker on or
+off just changes its entry in an opacity array, so the cost of a flip does not depend on how many markers are lit.
+
+"""
+
+# import useful modules
+import numpy as np
+from psychopy import visual
+
+# A routine to get the horizontal positions of markers covering the full width of the window (40 across)
+def markerPositions(windowWidth):
+    positions = np.arange(-windowWidth // 2, windowWidth // 2, windowWidth // 40)
+    return positions + 25  # add a slight horizontal adjustment to ensure markers do not go off screen
+
+# A row of white circular markers across the middle of the window
+class MarkerArray(object):
+
+    def __init__(self, win, radius=15):
+        xs = markerPositions(int(win.size[0]))  # generate markers to cover whole screen
+        self.visible = np.zeros(len(xs))  # opacity of each marker (0 off, 1 on)
+        self.stim = visual.ElementArrayStim(win, units='pix', nElements=len(xs), xys=np.column_stack([xs, 0 * xs]),
+                                            sizes=2 * radius, elementTex=None, elementMask='circle',
+                                            colors=(1, 1, 1), colorSpace='rgb', opacities=self.visible)
+        self.position = 0  # the marker the next key press changes
+        self.direction = 1  # markers go on from left to right (1), then off from right to left (-1)
+
+    def __len__(self):
+        return len(self.visible)
+
+    # A routine to turn marker k on or off (shown from the next flip)
+    def setVisible(self, k, visible):
+        self.visible[k] = 1 if visible else 0
+        self.stim.setOpacities(self.visible)
+
+    # A routine to move the markers on by one key press (shown from the next flip)
+    def advance(self):
+        self.setVisible(self.position, self.direction == 1)  # turn this marker on (or off on the way back)
+        self.position += self.direction  # move on to the next marker
+        if self.position == len(self) - 1:  # markers have reached the far side of the screen
+            self.direction = -1  # start going down
+        elif self.position == 0:  # markers are back at the start
+            self.direction = 1  # start going up again
+
+    # A routine to start drawing the markers on every flip, all turned off
+    def show(self):
+        self.visible[:] = 0
+        self.position = 0
+        self.direction = 1
+        self.stim.setOpacities(self.visible)
+        self.stim.setAutoDraw(True)
+
+    # A routine to stop drawing the markers
+    def hide(self):
+        self.stim.setAutoDraw(False)
+
+# A routine to handle the new key presses of the tapping loop: each one moves the markers on and updates the running
+# score. Used by the task and by replay, so both run the same code
+def addKeys(newKeys, markers, detector):
+    for thisKey in newKeys:
+        markers.advance()
+        detector.addKey(thisKey)
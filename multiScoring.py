@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Title: Multi-sequence scoring for the finger tapping task
+Scores a response stream against its target sequence (exactly as patternDetect does) and at the same time finds every
+occurrence of other sequences, e.g. the other learned sequence or the practice sequence intruding into the stream. All
+the sequences are matched together by an Aho-Corasick automaton in a single pass over the stream.
+
+"""
+
+# import useful modules
+from collections import deque
+import numpy as np
+
+# An Aho-Corasick automaton over a set of sequences of keys
+class SequenceAutomaton(object):
+
+    def __init__(self, sequences):
+        self.sequences = [list(map(int, list(sequence))) for sequence in sequences]
+        self.goto = [{}]  # goto[state][key] is the next state
+        self.fail = [0]  # state to fall back to when no transition matches
+        self.output = [[]]  # indexes of the sequences that end at each state
+        for n, sequence in enumerate(self.sequences):  # build the trie
+            state = 0
+            for item in sequence:
+                if item not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][item] = len(self.goto) - 1
+                state = self.goto[state][item]
+            self.output[state].append(n)
+        queue = deque(self.goto[0].values())  # add failure links, breadth first
+        while queue:
+            state = queue.popleft()
+            for item, nextState in self.goto[state].items():
+                queue.append(nextState)
+                fallback = self.fail[state]
+                while fallback and item not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nextState] = self.goto[fallback].get(item, 0)
+                self.output[nextState] = self.output[nextState] + self.output[self.fail[nextState]]
+
+    # A routine to move from state on key
+    def step(self, state, item):
+        while state and item not in self.goto[state]:
+            state = self.fail[state]
+        return self.goto[state].get(item, 0)
+
+    # A routine to find every occurrence of every sequence in a stream
+    # yields (sequence index, start position) in order of the end position
+    def findAll(self, stream):
+        state = 0
+        for position, item in enumerate(stream):
+            state = self.step(state, item)
+            for n in self.output[state]:
+                yield n, position - len(self.sequences[n]) + 1
+
+# Routine for analysing a response stream against its target sequence and a set of other sequences
+# returns the dictionary patternDetect returns (speed, errors, accuracy, identical values) plus:
+#   'completions'   number of occurrences of each sequence (target and others, overlapping occurrences all count)
+#   'intrusions'    start positions of each occurrence of each of the other sequences
+# otherSequences should not include targetSequence. Pass automaton (built from [targetSequence] + otherSequences) to
+# reuse it across streams
+def multiPatternDetect(stream, targetSequence, otherSequences, automaton=None):
+    if automaton is None:
+        automaton = SequenceAutomaton([targetSequence] + list(otherSequences))
+    target = list(map(int, list(targetSequence)))
+    stream = [int(item) for item in stream]
+    sequenceLength = len(target)
+    sequences = [str(sequence) for sequence in [targetSequence] + list(otherSequences)]  # in automaton order
+    completions = dict((sequence, 0) for sequence in sequences)
+    intrusions = dict((sequence, []) for sequence in sequences[1:])
+
+    # pre-load some variables
+    speed = float(0)  # store for complete sequences (i.e. speed)
+    errors = float(0)  # store for errors
+    contiguousError = 0  # store for contiguous incorrect items
+    i = 0  # position of the pattern detector
+
+    # a single pass: after each item, the window that ends there is known, so the pattern detector can decide the
+    # position the window starts at (if it is at that position) exactly as patternDetect would
+    state = 0
+    for end, item in enumerate(stream):
+        state = automaton.step(state, item)
+        targetEndsHere = False
+        for n in automaton.output[state]:  # every sequence that ends here
+            completions[sequences[n]] += 1
+            if n == 0:
+                targetEndsHere = True
+            else:
+                intrusions[sequences[n]].append(end - len(automaton.sequences[n]) + 1)
+        if i == end - sequenceLength + 1:  # the detector is at the start of the window that has just ended
+            if targetEndsHere:  # target sequence matched
+                speed += 1  # record a pattern completed
+                i += sequenceLength  # skip forward by length of targetSequence
+                if contiguousError >= 1:  # account for contiguous errors
+                    errors += 1
+                    contiguousError = 0
+            else:
+                contiguousError += 1  # record a 'contiguous error'
+                i += 1  # adjust index forward by 1
+                if contiguousError == 5 or i == len(stream):  # when count reaches 5 or this is the final item
+                    errors += 1
+                    contiguousError = 0
+
+    # the final items (less than a whole sequence from the end) are checked against a subset of the target sequence
+    while i < len(stream):
+        lastItems = stream[i:]
+        if lastItems == target[:len(lastItems)]:  # final items match the target sequence subset
+            speed += float(len(lastItems)) / float(sequenceLength)  # record fractional sequence
+            if contiguousError >= 1:
+                errors += 1
+                contiguousError = 0
+            break
+        contiguousError += 1
+        i += 1
+        if contiguousError == 5 or i == len(stream):  # when count reaches 5 or this is the final item
+            errors += 1
+            contiguousError = 0
+
+    if speed == 0:
+        accuracy = float('nan')
+    else:
+        accuracy = 1 - errors / speed  # calculate accuracy
+
+    return {'speed': speed, 'errors': errors, 'accuracy': accuracy, 'completions': completions,
+            'intrusions': intrusions}
+
+# Routine for analysing a list of response streams against one target sequence and a set of other sequences, with
+# one automaton for them all
+# returns a dictionary of arrays with a value per stream: speed, errors and accuracy (as batchPatternDetect returns)
+# and intrusions, the number of occurrences of the other sequences
+def batchMultiPatternDetect(streams, targetSequence, otherSequences):
+    automaton = SequenceAutomaton([targetSequence] + list(otherSequences))
+    output = dict((name, np.zeros(len(streams))) for name in ['speed', 'errors', 'accuracy', 'intrusions'])
+    for n, stream in enumerate(streams):
+        scores = multiPatternDetect(stream, targetSequence, otherSequences, automaton)
+        for measure in ['speed', 'errors', 'accuracy']:
+            output[measure][n] = scores[measure]
+        output['intrusions'][n] = sum(len(positions) for positions in scores['intrusions'].values())
+    return output
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Title: Trial replay for the finger tapping task
+Plays recorded trials (the keys and the time of each press) back through the task's input path - key presses are
+delivered to a KeyCapture handler and read out frame by frame with newPresses(), then handed to addKeys, the tapping
+loop's own routine for moving the markers and feeding the SequenceDetector - and checks the result against what was
+stored: the same keys, the same speed, errors and accuracy (also checked against patternDetect), and the markers
+ending in the right state.
+
+Trials can be replayed in real time (speed 1), faster (e.g. speed 10) or unthrottled (no speed: frames are stepped
+without waiting), which makes replaying a whole data directory a benchmark for the scoring and marker code.
+Without a display the psychopy and pyglet modules are replaced by the headless stand-ins from simulation.py.
+
+Run from the command line, e.g. 'python replay.py --dataDir data' or 'python replay.py --speed 1 --display'
+
+"""
+
+# import useful modules
+import argparse
+import sys
+import time
+import timeit
+import numpy as np
+from cohortAnalysis import findDataFiles, loadStore
+from scoring import SequenceDetector, patternDetect
+from simulation import SimulatedTime, makeStandIns
+
+framePeriod = 1.0 / 60  # refresh period of the lab monitors (seconds)
+trialLength = 30.0  # length of a tapping trial (seconds), used to spread out presses that have no timestamps
+
+# A routine to import the task modules replay needs, bound to psychopy and pyglet or (display False) to stand-ins
+# returns the keyCapture and markerArray modules and the visual module
+def loadTaskModules(display=False):
+    if display:
+        from psychopy import visual
+        import keyCapture
+        import markerArray
+        return keyCapture, markerArray, visual
+    standIns = makeStandIns(SimulatedTime(), None, {}, [])
+    replaced = dict((name, sys.modules.get(name)) for name in list(standIns) + ['keyCapture', 'markerArray'])
+    sys.modules.update(standIns)
+    try:
+        for name in ['keyCapture', 'markerArray']:  # make sure these bind to the stand-ins
+            sys.modules.pop(name, None)
+        import keyCapture
+        import markerArray
+    finally:  # put the real modules (if any) back for everything else
+        for name, module in replaced.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+    return keyCapture, markerArray, standIns['psychopy.visual']
+
+# A clock for replay: real time multiplied by speed, or (speed None) one frame period per frame with no waiting
+class ReplayClock(object):
+
+    def __init__(self, speed=None, framePeriod=framePeriod):
+        self.speed = speed
+        self.framePeriod = framePeriod
+        self.reset()
+
+    def reset(self):
+        self.start = timeit.default_timer()
+        self.frames = 0
+
+    def getTime(self):
+        if self.speed is None:
+            return self.frames * self.framePeriod
+        return (timeit.default_timer() - self.start) * self.speed
+
+    # A routine to wait for the start of the next frame
+    def flip(self):
+        self.frames += 1
+        if self.speed is not None:
+            wait = (self.frames * self.framePeriod - self.getTime()) / self.speed
+            if wait > 0:
+                time.sleep(wait)
+
+# Stands in for the window's pyglet handle: dispatch_events delivers the recorded presses whose time has come
+class ReplayHandle(object):
+
+    def __init__(self, clock, symbols):
+        self.clock = clock
+        self.symbols = symbols  # pyglet key symbol for each key code
+        self.handlers = []
+        self.load([], [])
+
+    def push_handlers(self, *handlers):
+        self.handlers.extend(handlers)
+
+    # A routine to set the presses of the next trial (times in seconds from the start of the trial)
+    def load(self, keys, times):
+        self.keys, self.times = [int(thisKey) for thisKey in keys], np.asarray(times, dtype=float)
+        self.nDelivered = 0
+        self.lags = []  # how long after its recorded time each press was delivered (seconds)
+
+    def pending(self):
+        return len(self.keys) - self.nDelivered
+
+    def dispatch_events(self):
+        now = self.clock.getTime()
+        while self.nDelivered < len(self.keys) and self.times[self.nDelivered] <= now:
+            for handler in reversed(self.handlers):  # most recently pushed first, as pyglet does
+                if hasattr(handler, 'on_key_press'):
+                    handler.on_key_press(self.symbols[self.keys[self.nDelivered]], 0)
+            self.lags.append(now - self.times[self.nDelivered])
+            self.nDelivered += 1
+
+# A routine to get which markers should be on after n key presses with nMarkers markers (worked out directly rather
+# than by stepping through the presses, as a check on the marker updates in the tapping loop)
+def expectedMarkers(nPresses, nMarkers):
+    visible = np.zeros(nMarkers)
+    if nPresses == 0:
+        return visible
+    position = nPresses % (2 * (nMarkers - 1))  # markers go up to nMarkers - 2 then back down to 1
+    if position <= nMarkers - 1:
+        visible[:position] = 1  # on the way up
+    else:
+        visible[:2 * nMarkers - 1 - position] = 1  # on the way down
+    visible[0] = 1  # the first marker is never turned off again
+    return visible
+
+# Replays trials through a KeyCapture, a MarkerArray and a SequenceDetector, with the tapping loop's own key handling
+class Replayer(object):
+
+    def __init__(self, speed=None, display=False):
+        keyCapture, markerArray, visual = loadTaskModules(display)
+        self.addKeys = markerArray.addKeys  # what the tapping loop does with each new key press
+        self.clock = ReplayClock(speed)
+        self.win = visual.Window(size=(1280, 1024), fullscr=display, units='pix', color='#89ba00')
+        symbols = dict((code, symbol) for symbol, code in keyCapture.responseKeys.items())
+        self.handle = ReplayHandle(self.clock, symbols)
+        self.capture = keyCapture.KeyCapture(self.handle, clock=self.clock)
+        self.markers = markerArray.MarkerArray(self.win)
+        self.display = display
+
+    # A routine to replay one trial. Returns the keys and times recorded, the score and the markers left on
+    def replayTrial(self, keys, times, targetSequence):
+        self.handle.load(keys, times)
+        detector = SequenceDetector(targetSequence)
+        self.clock.reset()
+        self.capture.reset()
+        self.markers.show()
+        while self.handle.pending():
+            newKeys, newTimes = self.capture.newPresses()
+            self.addKeys(newKeys, self.markers, detector)
+            if self.display:
+                self.win.flip()
+            self.clock.flip()
+        stream, keyTimes = self.capture.recorded()
+        return {'stream': stream, 'keyTimes': keyTimes, 'score': detector.score(),
+                'markers': self.markers.visible.copy(), 'lags': np.asarray(self.handle.lags)}
+
+    def close(self):
+        self.win.close()
+
+# A routine to compare two scores (nan equals nan). Scores read back from a csv file can be out in the last digit
+# (pandas' csv parser does not round-trip every float), so those are compared to within tolerance
+def sameScore(first, second, tolerance=0.0):
+    for measure in ['speed', 'errors', 'accuracy']:
+        a, b = float(first[measure]), float(second[measure])
+        if not (abs(a - b) <= tolerance * abs(b) or (np.isnan(a) and np.isnan(b))):
+            return False
+    return True
+
+# A routine to replay every trial of one participant's data file and check it against the stored results
+# returns one result per trial: 'problems' lists anything that did not match
+def replayFile(replayer, fileName):
+    store = loadStore(fileName)
+    streams, allTimes = store.lists('stream'), store.lists('keyTimes')
+    stored = dict((measure, store.column(measure)) for measure in ['speed', 'errors', 'accuracy'])
+    results = []
+    for n in range(len(store)):
+        stream, times = [int(thisKey) for thisKey in streams[n]], np.asarray(allTimes[n], dtype=float)
+        timed = len(times) == len(stream)
+        if not timed:  # older data without timestamps: spread the presses evenly over the trial
+            times = (np.arange(len(stream)) + 1) * trialLength / (len(stream) + 1)
+        targetSequence = str(store.column('targetSequence')[n])
+        output = replayer.replayTrial(stream, times, targetSequence)
+
+        problems = []
+        if output['stream'] != stream:
+            problems.append('keys')
+        if not sameScore(output['score'], dict((measure, stored[measure][n]) for measure in stored), 1e-12):
+            problems.append('stored score')
+        if not sameScore(output['score'], patternDetect(stream, targetSequence)):
+            problems.append('patternDetect')
+        if not np.array_equal(output['markers'], expectedMarkers(len(stream), len(replayer.markers))):
+            problems.append('markers')
+        results.append({'fileName': fileName, 'session': store.column('session')[n],
+                        'trial': store.column('trial')[n], 'keys': len(stream), 'timed': timed,
+                        'maxLag': float(output['lags'].max()) if len(stream) else 0.0, 'problems': problems})
+    return results
+
+# A routine to replay every participant in a data directory. Returns the per-trial results and the time taken
+def replayDirectory(dataDir, speed=None, display=False):
+    replayer = Replayer(speed, display)
+    startTime = timeit.default_timer()
+    try:
+        results = []
+        for fileName in findDataFiles(dataDir):
+            results.extend(replayFile(replayer, fileName))
+    finally:
+        replayer.close()
+    return results, timeit.default_timer() - startTime
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay recorded trials and check them against the stored results')
+    parser.add_argument('--dataDir', default='data', help='directory holding the P<participant>.csv files')
+    parser.add_argument('--speed', type=float, default=None,
+                        help='1 for real time, >1 for faster (default: unthrottled)')
+    parser.add_argument('--display', action='store_true', help='draw the markers in a psychopy window')
+    args = parser.parse_args()
+    results, duration = replayDirectory(args.dataDir, args.speed, args.display)
+    nKeys = sum(result['keys'] for result in results)
+    failed = [result for result in results if result['problems']]
+    for result in failed:
+        print('%s session %s trial %s: %s do not match' % (result['fileName'], result['session'], result['trial'],
+                                                           ', '.join(result['problems'])))
+    print('Replayed %i trials (%i keys, %i untimed trials) in %.3f seconds: %.0f keys per second' %
+          (len(results), nKeys, sum(not result['timed'] for result in results), duration,
+           nKeys / duration if duration else float('nan')))
+    print('%i trials did not match' % len(failed))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Title: Resampling statistics for the finger tapping task
+Bootstrap confidence intervals and permutation tests for the study's contrasts: speed (or another measure) on the old
+vs. the new sequence in each session, overall and within each counter-balancing group (sequenceOrder X/Y, testOrder
+A/B), and differences in that contrast between groups. Resamples are drawn as NumPy index (or sign) matrices, one row
+per resample, and processed in chunks, so 10^5 resamples over a whole cohort take seconds.
+
+Run from the command line, e.g. 'python resamplingStats.py --dataDir data --resamples 100000'
+
+"""
+
+# import useful modules
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from cohortAnalysis import findDataFiles, loadStore
+
+oldSequenceX = '41324'  # the old sequence for sequenceOrder X (for Y it is the new sequence)
+
+# A routine to load every participant's trials from a data directory into one DataFrame
+def loadTrials(dataDir):
+    frames = []
+    for fileName in findDataFiles(dataDir):
+        store = loadStore(fileName)
+        frames.append(pd.DataFrame(dict((name, store.column(name)) for name in
+                                        ['participant', 'session', 'targetSequence', 'sequenceType', 'trial',
+                                         'speed', 'errors', 'accuracy'])))
+    trials = pd.concat(frames, ignore_index=True)
+    for name in ['participant', 'session', 'targetSequence']:
+        trials[name] = trials[name].astype(str)
+    return trials
+
+# A routine to get one row per participant with their counter-balancing group and the mean of measure for each
+# session and sequence type (columns like '3_old'). Groups are worked out from the data: sequenceOrder from the old
+# sequence, testOrder from which sequence came first in session 3
+def participantTable(trials, measure='speed'):
+    trials = trials.copy()
+    trials['sessionNumber'] = trials['session'].str[0]
+    table = trials.groupby(['participant', 'sessionNumber', 'sequenceType'])[measure].mean().unstack(
+        ['sessionNumber', 'sequenceType'])
+    table.columns = ['%s_%s' % column for column in table.columns]
+
+    old = trials[trials['sequenceType'] == 'old'].groupby('participant')['targetSequence'].first()
+    table['sequenceOrder'] = np.where(old.reindex(table.index) == oldSequenceX, 'X', 'Y')
+    first3 = trials[trials['session'] == '3a'].groupby('participant')['sequenceType'].first().reindex(table.index)
+    table['testOrder'] = np.where(first3 == 'old', 'A', np.where(first3 == 'new', 'B', ''))
+    return table
+
+# A routine to draw resample rows in chunks (to bound memory), calling statistic on each chunk
+# draw(rng, rows) returns a (rows x n) index or sign matrix; returns the statistic of every resample
+def resample(draw, statistic, nResamples, seed, chunkSize=10000):
+    rng = np.random.RandomState(seed)
+    results = []
+    for start in range(0, nResamples, chunkSize):
+        results.append(statistic(draw(rng, min(chunkSize, nResamples - start))))
+    return np.concatenate(results)
+
+# A routine to get a bootstrap percentile confidence interval for the mean of values
+def bootstrapMean(values, nResamples=100000, confidence=0.95, seed=0):
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    n = len(values)
+    if n == 0:
+        return {'n': 0, 'mean': np.nan, 'lower': np.nan, 'upper': np.nan}
+    means = resample(lambda rng, rows: rng.randint(0, n, (rows, n)),
+                     lambda index: values[index].mean(axis=1), nResamples, seed)
+    tail = 100 * (1 - confidence) / 2
+    return {'n': n, 'mean': values.mean(), 'lower': np.percentile(means, tail),
+            'upper': np.percentile(means, 100 - tail)}
+
+# A routine to test whether paired differences have mean zero, by randomly flipping their signs (two-sided p value)
+def signFlipTest(differences, nResamples=100000, seed=0):
+    differences = np.asarray(differences, dtype=float)
+    differences = differences[~np.isnan(differences)]
+    n = len(differences)
+    if n == 0:
+        return np.nan
+    observed = abs(differences.mean())
+    means = resample(lambda rng, rows: rng.randint(0, 2, (rows, n)) * 2 - 1,
+                     lambda signs: (signs * differences).mean(axis=1), nResamples, seed)
+    return (np.sum(np.abs(means) >= observed - 1e-12) + 1.0) / (nResamples + 1.0)
+
+# A routine to compare the mean of values between two groups: permutation test of the group labels (two-sided p
+# value) and a bootstrap confidence interval (resampling within each group) for the difference firstGroup -
+# secondGroup. Values in neither group (e.g. no group yet) are left out; 'n' is the number compared
+def groupDifference(values, groups, firstGroup, secondGroup, nResamples=100000, confidence=0.95, seed=0):
+    values = np.asarray(values, dtype=float)
+    groups = np.asarray(groups)
+    keep = ~np.isnan(values) & ((groups == firstGroup) | (groups == secondGroup))
+    values, inFirst = values[keep], groups[keep] == firstGroup
+    nFirst, n = inFirst.sum(), len(values)
+    if nFirst == 0 or nFirst == n:
+        return {'n': n, 'difference': np.nan, 'p': np.nan, 'lower': np.nan, 'upper': np.nan}
+    observed = values[inFirst].mean() - values[~inFirst].mean()
+
+    # permutations: the first nFirst items of each random ordering form the first group
+    def permutedDifference(order):
+        permuted = values[order]
+        return permuted[:, :nFirst].mean(axis=1) - permuted[:, nFirst:].mean(axis=1)
+    differences = resample(lambda rng, rows: np.argsort(rng.rand(rows, n), axis=1), permutedDifference,
+                           nResamples, seed)
+    p = (np.sum(np.abs(differences) >= abs(observed) - 1e-12) + 1.0) / (nResamples + 1.0)
+
+    # bootstrap within each group: one uniform matrix, scaled to index each group's own values
+    first, second = values[inFirst], values[~inFirst]
+    def bootstrapDifference(uniform):
+        return (first[(uniform[:, :nFirst] * nFirst).astype(int)].mean(axis=1) -
+                second[(uniform[:, nFirst:] * (n - nFirst)).astype(int)].mean(axis=1))
+    differences = resample(lambda rng, rows: rng.rand(rows, n), bootstrapDifference, nResamples, seed + 1)
+    tail = 100 * (1 - confidence) / 2
+    return {'n': n, 'difference': observed, 'p': p, 'lower': np.percentile(differences, tail),
+            'upper': np.percentile(differences, 100 - tail)}
+
+# A routine to run every contrast: old minus new in each session with both (overall and per group), and the
+# difference in that contrast between counter-balancing groups. Returns a DataFrame with one row per contrast
+def analyseContrasts(trials, measure='speed', nResamples=100000, confidence=0.95, seed=0):
+    table = participantTable(trials, measure)
+    rows = []
+    for session in ['1', '2', '3']:
+        if '%s_old' % session not in table or '%s_new' % session not in table:
+            continue
+        differences = table['%s_old' % session] - table['%s_new' % session]
+        subsets = [('all', np.ones(len(table), dtype=bool))]
+        for factor in ['sequenceOrder', 'testOrder']:
+            for level in sorted(set(table[factor]) - set([''])):
+                subsets.append(('%s %s' % (factor, level), (table[factor] == level).values))
+        for label, chosen in subsets:
+            interval = bootstrapMean(differences[chosen], nResamples, confidence, seed)
+            rows.append({'session': session, 'contrast': 'old - new', 'participants': label,
+                         'n': interval['n'], 'estimate': interval['mean'], 'lower': interval['lower'],
+                         'upper': interval['upper'], 'p': signFlipTest(differences[chosen], nResamples, seed)})
+        for factor, firstGroup, secondGroup in [('sequenceOrder', 'X', 'Y'), ('testOrder', 'A', 'B')]:
+            result = groupDifference(differences, table[factor], firstGroup, secondGroup, nResamples, confidence,
+                                     seed)
+            rows.append({'session': session, 'contrast': '(old - new) %s %s - %s' % (factor, firstGroup, secondGroup),
+                         'participants': 'all', 'n': result['n'],
+                         'estimate': result['difference'], 'lower': result['lower'], 'upper': result['upper'],
+                         'p': result['p']})
+    return pd.DataFrame(rows, columns=['session', 'contrast', 'participants', 'n', 'estimate', 'lower', 'upper', 'p'])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bootstrap and permutation statistics for old vs. new contrasts')
+    parser.add_argument('--dataDir', default='data', help='directory holding the P<participant>.csv files')
+    parser.add_argument('--measure', default='speed', choices=['speed', 'errors', 'accuracy'])
+    parser.add_argument('--resamples', type=int, default=100000)
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=os.path.join('data', 'contrasts.csv'), help='results file to write')
+    args = parser.parse_args()
+    results = analyseContrasts(loadTrials(args.dataDir), args.measure, args.resamples, args.confidence, args.seed)
+    results.to_csv(args.output, index=False)
+    print(results.to_string(index=False))
@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Title: Scoring routines for the finger tapping task
+Scores response streams for speed (complete sequences), errors and accuracy. patternDetect scores a single trial and
+is the reference implementation; batchPatternDetect scores many stored trials at once and SequenceDetector scores a
+trial as it is being typed. Both give identical results to patternDetect.
+
+"""
+
+# import useful modules
+import numpy as np
+
+# version of the scoring rules: change this whenever patternDetect's results change, so cached scores are not reused
+scoringRuleVersion = 1
+
+# Routine for analysing the response stream
+def patternDetect(stream, targetSequence):
+    # pre-load some variables
+    targetSequence = list(map(int, list(targetSequence)))
+    stream = list(stream)
+    speed = float(0) # store for complete sequences(i.e. speed)
+    contiguousError = 0 # store for contiguous incorrect items
+    errors = float(0) # store for errors
+    i = 0  # start at position 1
+
+    # start pattern detector
+
+    while i < len(stream):  # search through every item in stream
+
+        # for all expect final items (which are anything less than a whole sequence at the end of the stream)
+        if i <= len(stream) - len(targetSequence):
+
+            # if the next sequence length of items in the stream matches the target sequence
+            if stream[i:(i + len(targetSequence))] == targetSequence:
+
+                speed += 1  # record a pattern completed
+                i += len(targetSequence)  # adjust position to skip forward by length of targetSequence
+
+                # CHECK ERRORS need to reset contiguous error counter and add any accumulated errors to the total count
+                if contiguousError >= 1:  # check if there are contiguous errors we have not yet accounted for
+
+                    errors += 1 # add an error to the total count
+                    contiguousError = 0 # reset contiguous error count
+
+            # else if the next sequence length of items in the stream does not match the target sequence
+            elif stream[i:(i + len(targetSequence))] != targetSequence:
+
+                contiguousError += 1  # record a 'contiguous error'
+                i += 1  # adjust index forward by 1
+
+                # CHECK ERRORS when contiguous error count reaches 5 or if this is the final item of the stream
+                if contiguousError == 5 or i == len(stream):
+                    errors += 1 # add an error to the total count
+                    contiguousError = 0 # reset contiguous error count
+        # now deal with last items of the stream (a special case, see 'method' above)
+        else:
+
+            # get last items
+            lastItems = stream[i:]
+
+            # get subset of target sequence of same length as last items
+            sequenceSubset = targetSequence[:len(lastItems)]
+
+            while lastItems != None:  # while there are additional items left to check
+
+                if lastItems == sequenceSubset:  # if lastItems match target sequence subset
+
+                    speed += float(len(lastItems)) / float(len(targetSequence))  # record fractional sequence
+
+                    if contiguousError >= 1:  # check if there are errors we have not yet recorded
+
+                        errors += 1  # add an error to total
+
+                        contiguousError = 0  # reset contiguous error count
+
+                    lastItems = None  # force failure of inner while loop by updating lastItems
+
+                    i = len(stream)  # force failure of outer while loop by updating i
+
+                else:  # if lastItems do not match target sequence
+
+                    contiguousError += 1  # add 1 to contiguous error count
+
+                    # when contiguous error count reaches 5 or if this is final item
+                    if contiguousError == 5 or len(lastItems) == 1:
+                        errors += 1  # add an error to total
+                        contiguousError = 0  # reset contiguous error count
+
+                    if len(lastItems) == 1:  # if this is the final item
+
+                        lastItems = None  # force failure of inner while loop by updating lastItems
+
+                        i = len(stream)  # force failure of outer while loop by updating i
+
+                    else:  # else if there are still items left to check
+
+                        lastItems = lastItems[1:]  # drop the first item from lastItems
+
+                        sequenceSubset = sequenceSubset[:-1]  # drop the last item from the sequence subset
+
+    # integrity check
+    if speed == 0:
+        print('Issue with this stream - speed is zero')
+        accuracy = float('nan')
+    else:
+        accuracy = 1 - errors / speed  # calculate accuracy
+
+    return {'speed': speed, 'errors': errors, 'accuracy': accuracy}
+
+# A routine to pack a list of response streams into one flat values array plus an offsets array
+# stream n occupies values[offsets[n]:offsets[n + 1]]
+def packStreams(streams):
+    streams = [list(stream) for stream in streams]  # make sure every stream is a list
+    lengths = np.array([len(stream) for stream in streams], dtype=np.int64)  # get length of each stream
+    offsets = np.zeros(len(streams) + 1, dtype=np.int64)  # set up offsets (one more than the number of streams)
+    offsets[1:] = np.cumsum(lengths)  # each stream starts where the previous one ends
+    values = np.zeros(offsets[-1], dtype=np.int8)  # set up flat values store
+    for n, stream in enumerate(streams):  # for each stream
+        values[offsets[n]:offsets[n + 1]] = stream  # copy the stream into place
+    return values, offsets
+
+# A routine to convert a padded 2-D array of streams (one row per stream) into flat values and offsets
+def unpadStreams(padded, lengths=None):
+    padded = np.asarray(padded)
+    if lengths is None:  # if no lengths given, every row is treated as a full stream
+        lengths = np.full(padded.shape[0], padded.shape[1], dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(lengths)
+    keep = np.arange(padded.shape[1])[np.newaxis, :] < lengths[:, np.newaxis]  # mask out the padding
+    values = padded[keep]  # row-major order keeps each stream contiguous
+    return values, offsets
+
+# A routine to find, for every position of every stream, how many items of the target sequence are matched there
+# a full match scores len(targetSequence); at the end of a stream a match of the remaining items scores their number
+# anything else scores 0. This is the 'stream[i:(i + len(targetSequence))] == targetSequence' test (and the lastItems
+# test for the final items) of patternDetect, done for all positions at once
+def matchLengths(values, offsets, targetSequence):
+    targetSequence = list(map(int, list(targetSequence)))
+    offsets = np.asarray(offsets, dtype=np.int64)
+    total = offsets[-1]  # total number of items across all streams
+    values = np.append(np.asarray(values)[:total], np.zeros(len(targetSequence), dtype=np.int8))  # pad the end
+    streamEnd = np.repeat(offsets[1:], np.diff(offsets))  # end of the stream each item belongs to
+    remaining = (streamEnd - np.arange(total)).astype(np.int32)  # items left in the stream from each position
+    run = np.zeros(total, dtype=np.int8)  # store for length of matching run from each position
+    alive = np.ones(total, dtype=bool)  # positions where the run is still matching
+    for k, target in enumerate(targetSequence):  # for each item of the target sequence
+        alive &= values[k:k + total] == target  # does item k from each position match?
+        alive &= remaining > k  # runs also stop at the end of the stream
+        run += alive  # extend surviving runs by one
+    matched = (run == len(targetSequence)) | (run == remaining)  # full sequence or all of the final items
+    return np.where(matched, run, 0)
+
+# A routine to find the positions the pattern detector visits in every stream, and what it matches at each
+# returns the visited positions (into values) and the number of items matched at each (0 for an incorrect item)
+def detectorPath(values, offsets, targetSequence):
+    offsets = np.asarray(offsets, dtype=np.int64)
+    matchLength = matchLengths(values, offsets, targetSequence)  # what would be matched at each position
+    total = offsets[-1]  # index used as a 'finished' marker
+
+    # work out where the detector moves to from each position: skip a matched sequence, otherwise move forward by 1
+    # a match never runs past the end of its stream, so the last move of a stream lands on the start of the next one
+    # (which is visited anyway) or on the 'finished' marker
+    nextPosition = np.append(np.arange(total) + np.maximum(matchLength, 1), total)
+
+    # mark the positions the detector visits by pointer doubling: after round k visited holds every position reached
+    # in fewer than 2^k moves from a stream start, and jump moves 2^k positions at once, so the number of rounds only
+    # grows with the log of the longest stream
+    visited = np.zeros(total + 1, dtype=bool)
+    visited[offsets[:-1]] = True  # start of every stream
+    jump = nextPosition
+    longest = np.diff(offsets).max() if len(offsets) > 1 else 0
+    for doubling in range(int(longest).bit_length()):  # 2^rounds > longest, so every reachable position is marked
+        reached = jump[visited]
+        if visited[reached].all():  # nothing new, so no longer jump can add anything either
+            break
+        visited[reached] = True
+        jump = jump[jump]
+
+    visitedPositions = np.nonzero(visited[:total])[0]
+    return visitedPositions, matchLength[visitedPositions]
+
+# Routine for analysing many response streams at once
+# streams can be a padded 2-D array (one row per stream, give lengths if rows are padded), a flat values array with
+# offsets (offsets[0] is 0), or a list of streams. Returns arrays of speed, errors and accuracy identical to calling
+# patternDetect on each stream
+def batchPatternDetect(streams, targetSequence, offsets=None, lengths=None):
+    # get the streams into flat values and offsets
+    if offsets is not None:  # already in ragged layout
+        values = np.asarray(streams)
+        offsets = np.asarray(offsets, dtype=np.int64)
+    elif isinstance(streams, np.ndarray) and streams.ndim == 2:  # padded 2-D layout
+        values, offsets = unpadStreams(streams, lengths)
+    else:  # list of streams
+        values, offsets = packStreams(streams)
+
+    sequenceLength = len(targetSequence)
+    nStreams = len(offsets) - 1
+    visitedPositions, step = detectorPath(values, offsets, targetSequence)
+
+    # score the visited positions
+    streamId = np.repeat(np.arange(nStreams), np.diff(offsets))[visitedPositions]  # which stream each belongs to
+
+    # speed: count of complete sequences, plus a fractional sequence if the final items match
+    complete = np.bincount(streamId[step == sequenceLength], minlength=nStreams).astype(float)
+    partial = (step > 0) & (step < sequenceLength)
+    fraction = np.zeros(nStreams)
+    fraction[streamId[partial]] = step[partial] / float(sequenceLength)
+    speed = complete + fraction
+
+    # errors: each run of contiguous incorrect items counts 1 error per 5 items (rounding up), whether the run is
+    # ended by a matched sequence or by the end of the stream
+    miss = step == 0
+    newStream = np.ones(len(visitedPositions), dtype=bool)
+    newStream[1:] = streamId[1:] != streamId[:-1]
+    runStart = miss & (newStream | ~np.roll(miss, 1))
+    runEnd = miss & (np.append(newStream[1:], True) | ~np.roll(miss, -1))
+    runLength = np.nonzero(runEnd)[0] - np.nonzero(runStart)[0] + 1
+    errors = np.bincount(streamId[runStart], weights=(runLength + 4) // 5, minlength=nStreams).astype(float)
+
+    # calculate accuracy, which is undefined when speed is zero
+    accuracy = np.full(nStreams, np.nan)
+    scored = speed != 0
+    accuracy[scored] = 1 - errors[scored] / speed[scored]
+
+    return {'speed': speed, 'errors': errors, 'accuracy': accuracy}
+
+# An incremental pattern detector that is fed the response stream one key at a time
+# keeps only the last few keys (never more than the length of the target sequence) so each key costs the same
+# regardless of how long the trial has run. score() gives the same result as patternDetect on the keys so far
+class SequenceDetector(object):
+
+    def __init__(self, targetSequence):
+        self.targetSequence = list(map(int, list(targetSequence)))
+        self.nKeys = 0  # number of keys fed in so far
+        self.pending = []  # keys from the current position onwards that have not been decided yet
+        self.speed = float(0)  # store for complete sequences (i.e. speed)
+        self.errors = float(0)  # store for errors
+        self.contiguousError = 0  # store for contiguous incorrect items
+
+    # A routine to feed in the next key of the response stream
+    def addKey(self, key):
+        self.nKeys += 1
+        self.pending.append(int(key))
+        # once there are more keys than a sequence length we know the current position is not among the final
+        # items, so it can be decided for good
+        while len(self.pending) > len(self.targetSequence):
+            self.speed, self.errors, self.contiguousError, matched = detectStep(
+                self.pending, self.targetSequence, self.speed, self.errors, self.contiguousError)
+            del self.pending[:max(matched, 1)]  # skip forward by the matched items, or by 1
+
+    # A routine to get speed, errors and accuracy for the keys so far (the undecided keys are treated as the final
+    # items of the stream)
+    def score(self):
+        speed, errors, contiguousError = self.speed, self.errors, self.contiguousError
+        i = 0
+        while i < len(self.pending):
+            speed, errors, contiguousError, matched = detectStep(
+                self.pending[i:], self.targetSequence, speed, errors, contiguousError)
+            i += max(matched, 1)
+
+        if speed == 0:
+            accuracy = float('nan')
+        else:
+            accuracy = 1 - errors / speed  # calculate accuracy
+
+        return {'speed': speed, 'errors': errors, 'accuracy': accuracy}
+
+# A routine to take one step of the pattern detector at the start of items (the rest of the stream)
+# returns the updated speed, errors and contiguous error count, plus the number of items matched (0 if none)
+def detectStep(items, targetSequence, speed, errors, contiguousError):
+    matched = len(targetSequence)
+    if len(items) < matched:  # final items: try to match a subset of the target sequence of the same length
+        matched = len(items)
+
+    if items[:matched] == targetSequence[:matched]:  # sequence (or subset) matched
+        speed += float(matched) / float(len(targetSequence))  # record a (fractional) sequence
+        if contiguousError >= 1:  # check if there are contiguous errors we have not yet accounted for
+            errors += 1  # add an error to the total count
+            contiguousError = 0  # reset contiguous error count
+        return speed, errors, contiguousError, matched
+
+    contiguousError += 1  # record a 'contiguous error'
+    if contiguousError == 5 or len(items) == 1:  # when count reaches 5 or if this is the final item
+        errors += 1  # add an error to the total count
+        contiguousError = 0  # reset contiguous error count
+    return speed, errors, contiguousError, 0
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Title: Scoring cache for the finger tapping task
+Remembers the score of every (stream, target sequence) pair so re-analyses only score new or changed trials. Scores
+are kept in memory (least recently used are dropped first) and in an SQLite file, e.g. in the data directory. Entries
+are keyed by a hash of the stream, the target sequence and scoringRuleVersion, so changing the rules invalidates them.
+An entry can also hold the number of intrusions of other sequences (see multiScoring), along with which sequences were
+counted, so those are only counted for streams not already scored against the same sequences.
+
+"""
+
+# import useful modules
+import hashlib
+import sqlite3
+from collections import OrderedDict
+import numpy as np
+from scoring import batchPatternDetect, scoringRuleVersion
+from multiScoring import batchMultiPatternDetect
+
+measures = ['speed', 'errors', 'accuracy']
+
+# A routine to build the cache key for one stream
+def cacheKey(stream, targetSequence, ruleVersion=scoringRuleVersion):
+    digest = hashlib.sha1(('%s|%s|' % (ruleVersion, targetSequence)).encode('utf-8'))
+    digest.update(np.asarray(stream, dtype=np.int8).tobytes())
+    return digest.hexdigest()
+
+# A cache of scores in memory and (optionally) on disk
+class ScoringCache(object):
+
+    # fileName is the SQLite file for the on-disk layer (None for memory only); maxSize is the number of scores kept
+    # in memory
+    def __init__(self, fileName=None, maxSize=100000, ruleVersion=scoringRuleVersion):
+        self.maxSize = maxSize
+        self.ruleVersion = ruleVersion
+        self.memory = OrderedDict()  # key: (speed, errors, accuracy, intrusions, otherSequences), most recent last
+        self.memoryHits = 0
+        self.diskHits = 0
+        self.misses = 0
+        self.database = None
+        if fileName is not None:
+            self.database = sqlite3.connect(fileName, timeout=60)  # other processes may be writing too
+            self.database.execute('CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, ruleVersion INTEGER, '
+                                  'speed REAL, errors REAL, accuracy REAL, intrusions REAL, otherSequences TEXT)')
+            columns = [row[1] for row in self.database.execute('PRAGMA table_info(scores)')]
+            for column, columnType in [('intrusions', 'REAL'), ('otherSequences', 'TEXT')]:  # cache from before these
+                if column not in columns:
+                    self.database.execute('ALTER TABLE scores ADD COLUMN %s %s' % (column, columnType))
+            self.database.execute('DELETE FROM scores WHERE ruleVersion != ?', (ruleVersion,))  # out of date
+            self.database.commit()
+
+    # A routine to add scores to the in-memory layer, dropping the least recently used if it is full
+    def remember(self, key, score):
+        self.memory[key] = score  # new keys go to the end, i.e. most recently used
+        while len(self.memory) > self.maxSize:
+            self.memory.popitem(last=False)
+
+    # A routine to look up scores on disk for a list of keys; returns a dictionary of the ones found
+    def readDisk(self, keys):
+        found = {}
+        if self.database is None:
+            return found
+        for start in range(0, len(keys), 500):  # SQLite limits the number of parameters per query
+            chunk = keys[start:start + 500]
+            rows = self.database.execute('SELECT key, speed, errors, accuracy, intrusions, otherSequences FROM scores '
+                                         'WHERE key IN (%s)' % ','.join('?' * len(chunk)), chunk)
+            for row in rows:
+                found[row[0]] = tuple(np.nan if value is None else value for value in row[1:5]) + (row[5],)
+        return found
+
+    # A routine to score streams against one target sequence, scoring only the ones not cached
+    # returns the same dictionary of arrays as batchPatternDetect; if otherSequences is given, also the intrusions
+    # of those sequences (as batchMultiPatternDetect), and an entry only counts as cached if it has them
+    def score(self, streams, targetSequence, otherSequences=None):
+        others = None if otherSequences is None else ','.join(str(sequence) for sequence in otherSequences)
+        keys = [cacheKey(stream, targetSequence, self.ruleVersion) for stream in streams]
+        scores = [None] * len(keys)
+        for n, key in enumerate(keys):  # in memory?
+            if key in self.memory and (others is None or self.memory[key][4] == others):
+                scores[n] = self.memory.pop(key)
+                self.remember(key, scores[n])  # now the most recently used
+                self.memoryHits += 1
+
+        missing = [n for n in range(len(keys)) if scores[n] is None]
+        found = self.readDisk([keys[n] for n in missing])  # on disk?
+        for n in missing:
+            if keys[n] in found and (others is None or found[keys[n]][4] == others):
+                scores[n] = found[keys[n]]
+                self.remember(keys[n], scores[n])
+                self.diskHits += 1
+
+        missing = [n for n in missing if scores[n] is None]  # score the rest
+        if missing:
+            if others is None:
+                output = batchPatternDetect([streams[n] for n in missing], targetSequence)
+                output['intrusions'] = np.full(len(missing), np.nan)
+            else:  # one pass scores the stream and counts the intrusions
+                output = batchMultiPatternDetect([streams[n] for n in missing], targetSequence, otherSequences)
+            newRows = []
+            for i, n in enumerate(missing):
+                scores[n] = tuple(float(output[measure][i]) for measure in measures + ['intrusions']) + (others,)
+                self.remember(keys[n], scores[n])
+                newRows.append((keys[n], self.ruleVersion) + scores[n])
+            self.misses += len(missing)
+            if self.database is not None:
+                self.database.executemany('INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?, ?, ?)', newRows)
+                self.database.commit()
+
+        names = measures if others is None else measures + ['intrusions']
+        values = np.array([score[:len(names)] for score in scores], dtype=float).reshape(len(keys), len(names))
+        return dict((name, values[:, i]) for i, name in enumerate(names))
+
+    # A routine to get the hit and miss counts
+    def counts(self):
+        return {'memoryHits': self.memoryHits, 'diskHits': self.diskHits, 'misses': self.misses}
+
+    def close(self):
+        if self.database is not None:
+            self.database.close()
+            self.database = None
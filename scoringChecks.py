@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Title: Equivalence checks for the finger tapping task scorers
+patternDetect is the reference: every other scorer (batchPatternDetect from lists and from padded arrays,
+SequenceDetector fed key by key, multiPatternDetect and ScoringCache) must give exactly the same speed, errors and
+accuracy on every stream. The streams are random ones plus adversarial ones aimed at the tricky parts of
+patternDetect: empty and one-key streams, all errors, perfect typing cut off at every point in the final sequence,
+runs of errors either side of the cap of 5, and final items that only partly match the target sequence.
+
+Run from the command line, e.g. 'python scoringChecks.py --random 5000'. Use 'python benchmark.py throughput' for
+the speed of each scorer.
+
+"""
+
+# import useful modules
+import argparse
+import sys
+import numpy as np
+from scoring import patternDetect, batchPatternDetect, SequenceDetector
+from scoringCache import ScoringCache
+from multiScoring import SequenceAutomaton, multiPatternDetect
+
+measures = ['speed', 'errors', 'accuracy']
+taskSequences = ['41324', '23142', '32413']  # the two learned sequences and the practice sequence
+# target sequences to check: the task's, plus ones that overlap themselves or are very short
+checkSequences = taskSequences + ['1', '11', '1212', '1121', '12341234']
+
+# swallows patternDetect's 'speed is zero' messages while checking
+class Discard(object):
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+# A routine to score streams with patternDetect without printing anything
+def referenceScores(streams, targetSequence):
+    stdout, sys.stdout = sys.stdout, Discard()
+    try:
+        return [patternDetect(stream, targetSequence) for stream in streams]
+    finally:
+        sys.stdout = stdout
+
+# A routine to generate the adversarial streams for a target sequence, as (description, stream) pairs
+def adversarialStreams(targetSequence):
+    target = list(map(int, list(targetSequence)))
+    sequenceLength = len(target)
+    wrong = [key for key in [1, 2, 3, 4] if key != target[0]] or [1]  # keys that cannot start a sequence
+    streams = [('empty', [])]
+    streams += [('one key %i' % key, [key]) for key in [1, 2, 3, 4]]
+    streams += [('all errors x%i' % n, [wrong[0]] * n) for n in [1, 4, 5, 6, 10, 11, 100]]
+    for n in range(3 * sequenceLength + 1):  # perfect typing stopped at every point
+        streams.append(('perfect, %i keys' % n, list(np.resize(target, n))))
+    for run in range(1, 13):  # runs of errors around the cap of 5, between sequences and at the end
+        streams.append(('error run %i between sequences' % run, target + [wrong[0]] * run + target))
+        streams.append(('error run %i at the end' % run, target + [wrong[0]] * run))
+        streams.append(('error run %i at the start' % run, [wrong[0]] * run + target))
+    for n in range(1, sequenceLength):  # final items that are not a start of the target sequence
+        streams.append(('ends with last %i items' % n, target + target[-n:]))
+        streams.append(('ends with first %i items after errors' % n, target + [wrong[0]] * 3 + target[:n]))
+        streams.append(('ends with first %i items then an error' % n, target + target[:n] + [wrong[0]]))
+    streams.append(('long stream', list(np.resize(target + [wrong[0]], 10000))))
+    return streams
+
+# A routine to generate random streams: uniform keys, and the target sequence typed with slips
+def randomStreams(targetSequence, nStreams, maxLength=60, seed=0):
+    rng = np.random.RandomState(seed)
+    target = list(map(int, list(targetSequence)))
+    streams = []
+    for n in range(nStreams):
+        length = rng.randint(0, maxLength + 1)
+        if n % 2:  # uniform random keys
+            stream = rng.randint(1, 5, length)
+        else:  # typed with a random error rate, so some streams have long error runs and others none
+            stream = np.resize(target, length)
+            slips = rng.rand(length) < rng.choice([0.02, 0.1, 0.3, 0.8])
+            stream[slips] = rng.randint(1, 5, slips.sum())
+        streams.append(('random %i' % n, [int(key) for key in stream]))
+    return streams
+
+# A routine to score streams by feeding them to a SequenceDetector one key at a time
+def detectorScores(streams, targetSequence):
+    scores = []
+    for stream in streams:
+        detector = SequenceDetector(targetSequence)
+        for key in stream:
+            detector.addKey(key)
+        scores.append(detector.score())
+    return scores
+
+# A routine to score streams with multiPatternDetect, with the other task sequences as possible intrusions
+def multiScores(streams, targetSequence):
+    otherSequences = [sequence for sequence in taskSequences if sequence != targetSequence]
+    automaton = SequenceAutomaton([targetSequence] + otherSequences)
+    return [multiPatternDetect(stream, targetSequence, otherSequences, automaton) for stream in streams]
+
+# A routine to score streams as a padded 2-D array
+def paddedScores(streams, targetSequence):
+    lengths = np.array([len(stream) for stream in streams])
+    padded = np.zeros((len(streams), max(lengths.max(), 1) if len(streams) else 1), dtype=np.int8)
+    for n, stream in enumerate(streams):
+        padded[n, :len(stream)] = stream
+    return batchPatternDetect(padded, targetSequence, lengths=lengths)
+
+# A routine to score streams through a ScoringCache (in memory), twice so the second pass comes from the cache
+def cachedScores(streams, targetSequence):
+    cache = ScoringCache()
+    cache.score(streams, targetSequence)
+    return cache.score(streams, targetSequence)
+
+# A routine to score streams through a ScoringCache counting intrusions too, after caching them without
+def cachedIntrusionScores(streams, targetSequence):
+    cache = ScoringCache()
+    cache.score(streams, targetSequence)
+    otherSequences = [sequence for sequence in taskSequences if sequence != targetSequence]
+    cache.score(streams, targetSequence, otherSequences)
+    return cache.score(streams, targetSequence, otherSequences)
+
+# the scorers checked against patternDetect: each takes a list of streams and a target sequence and returns a list
+# of score dictionaries or a dictionary of arrays
+scorers = {'batchPatternDetect': batchPatternDetect,
+           'batchPatternDetect (padded)': paddedScores,
+           'SequenceDetector': detectorScores,
+           'multiPatternDetect': multiScores,
+           'ScoringCache': cachedScores,
+           'ScoringCache (with intrusions)': cachedIntrusionScores}
+
+# A routine to get a measure for every stream from either form of output
+def measureValues(output, measure):
+    if isinstance(output, dict):
+        return np.asarray(output[measure], dtype=float)
+    return np.array([row[measure] for row in output], dtype=float)
+
+# A routine to check every scorer on every stream. Returns a list of the disagreements found
+def checkEquivalence(targetSequences=checkSequences, nRandom=2000, seed=0):
+    failures = []
+    for targetSequence in targetSequences:
+        cases = adversarialStreams(targetSequence) + randomStreams(targetSequence, nRandom, seed=seed)
+        streams = [stream for description, stream in cases]
+        reference = referenceScores(streams, targetSequence)
+        for name, scorer in sorted(scorers.items()):
+            output = scorer(streams, targetSequence)
+            for measure in measures:
+                expected, found = measureValues(reference, measure), measureValues(output, measure)
+                # exact agreement, with nan (no complete sequences) only matching nan
+                for n in np.nonzero(~((expected == found) | (np.isnan(expected) & np.isnan(found))))[0]:
+                    failures.append({'scorer': name, 'targetSequence': targetSequence, 'stream': cases[n][0],
+                                     'measure': measure, 'expected': expected[n], 'found': found[n]})
+    return failures
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check every scorer gives exactly the same results as patternDetect')
+    parser.add_argument('--random', type=int, default=2000, help='number of random streams per target sequence')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    failures = checkEquivalence(nRandom=args.random, seed=args.seed)
+    for failure in failures[:20]:
+        print('%(scorer)s, target %(targetSequence)s, %(stream)s: %(measure)s %(found)s, expected %(expected)s' %
+              failure)
+    print('%i scorers checked on %i target sequences: %i disagreements' % (len(scorers), len(checkSequences),
+                                                                           len(failures)))
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Title: Headless simulated participants for the finger tapping task
+Runs fingerTapping.py without a display or a keyboard. The psychopy window, stimuli, dialogs and event module (and
+pyglet's key handling) are swapped for stand-ins, and a synthetic typist presses keys whenever the screen turns green.
+Time runs on a simulated clock that can go faster than real time, so a whole session takes seconds.
+
+e.g. runSession(SyntheticTypist(tapRate=6.0, errorRate=0.05), participant='901', speed=100)
+
+"""
+
+# import useful modules
+import itertools
+import os
+import runpy
+import sys
+import time
+import types
+import numpy as np
+
+scriptFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fingerTapping.py')
+
+# pyglet key symbols for the keys the task uses (same values as pyglet.window.key)
+keySymbols = {'_1': 0x031, '_2': 0x032, '_3': 0x033, '_4': 0x034, 'SPACE': 0x020, 'ESCAPE': 0xff1b}
+digitSymbols = {1: keySymbols['_1'], 2: keySymbols['_2'], 3: keySymbols['_3'], 4: keySymbols['_4']}
+
+# background colours the task uses to start and stop tapping
+tappingColour = '#89ba00'
+restColour = '#ff0000'
+
+# raised by the stand-in core.quit() to end the script
+class SessionEnded(Exception):
+    pass
+
+# A generator of synthetic key streams: types the target sequence over and over
+# tapRate is the mean number of key presses per second, errorRate the chance each press is a random wrong key, and
+# timing the distribution of intervals between presses: 'constant', 'normal', 'gamma' or 'exponential' (cv sets the
+# spread of 'normal' and 'gamma'). reactionTime is the delay before the first press after the screen turns green
+class SyntheticTypist(object):
+
+    def __init__(self, tapRate=6.0, errorRate=0.05, timing='gamma', cv=0.3, reactionTime=0.3, seed=0):
+        self.tapRate = tapRate
+        self.errorRate = errorRate
+        self.timing = timing
+        self.cv = cv
+        self.reactionTime = reactionTime
+        self.rng = np.random.RandomState(seed)
+
+    # A routine to get the intervals between n presses
+    def intervals(self, n):
+        mean = 1.0 / self.tapRate
+        if self.timing == 'constant':
+            return np.full(n, mean)
+        if self.timing == 'normal':
+            return np.maximum(self.rng.normal(mean, self.cv * mean, n), 0.001)
+        if self.timing == 'gamma':
+            shape = 1.0 / self.cv ** 2
+            return self.rng.gamma(shape, mean / shape, n)
+        if self.timing == 'exponential':
+            return self.rng.exponential(mean, n)
+        raise ValueError('Unknown timing distribution: %s' % self.timing)
+
+    # A routine to generate the key presses of one trial lasting duration seconds
+    # returns arrays of keys and press times (seconds from the start of the trial)
+    def generate(self, targetSequence, duration):
+        n = int(duration * self.tapRate * 2) + 10  # comfortably more presses than fit in the trial
+        times = self.reactionTime + np.cumsum(self.intervals(n))
+        keys = np.resize(list(map(int, list(targetSequence))), n)
+        slips = self.rng.rand(n) < self.errorRate  # choose which presses are errors
+        keys[slips] = self.rng.randint(1, 5, slips.sum())
+        keep = times < duration
+        return keys[keep], times[keep]
+
+# simulated time: real time since start, multiplied by speed
+class SimulatedTime(object):
+
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self.start = time.time()
+
+    def now(self):
+        return (time.time() - self.start) * self.speed
+
+    # A routine to wait until a simulated time
+    def sleepUntil(self, then):
+        wait = (then - self.now()) / self.speed
+        if wait > 0:
+            time.sleep(wait)
+
+# A routine to build the stand-in psychopy and pyglet modules, all sharing one simulated clock and window state
+def makeStandIns(simulatedTime, typist, responses, trials):
+    state = {'window': None}
+
+    # core
+    class Clock(object):
+        def __init__(self):
+            self.start = simulatedTime.now()
+
+        def getTime(self):
+            return simulatedTime.now() - self.start
+
+        def reset(self):
+            self.start = simulatedTime.now()
+
+    class CountdownTimer(Clock):
+        def __init__(self, start=0):
+            Clock.__init__(self)
+            self.duration = start
+
+        def getTime(self):
+            return self.duration - Clock.getTime(self)
+
+    def quit():
+        raise SessionEnded()
+
+    # window and stimuli
+    class WindowHandle(object):
+        def __init__(self, window):
+            self.window = window
+            self.handlers = []
+
+        def push_handlers(self, *handlers):
+            self.handlers.extend(handlers)
+
+        # deliver every scheduled key press whose time has come to the handlers (most recently pushed first)
+        def dispatch_events(self):
+            self.window.deliverPresses()
+
+    class Window(object):
+        def __init__(self, size=(1280, 1024), **kwargs):
+            self.size = np.array(size)
+            self.monitorFramePeriod = 1.0 / 60
+            self.winHandle = WindowHandle(self)
+            self.targetSequence = ''
+            self.keys, self.times, self.nDelivered = np.zeros(0, dtype=int), np.zeros(0), 0
+            self.trial = None
+            self.flips = 0
+            state['window'] = self
+
+        # a flip waits for the next screen refresh
+        def flip(self, clearBuffer=True):
+            now = simulatedTime.now()
+            simulatedTime.sleepUntil((np.floor(now / self.monitorFramePeriod) + 1) * self.monitorFramePeriod)
+            self.flips += 1
+
+        # the typist starts when the screen turns green and stops when it turns red
+        def setColor(self, color, colorSpace=None):
+            if color == tappingColour:
+                self.keys, self.times = typist.generate(self.targetSequence, 60.0)
+                self.times = self.times + simulatedTime.now()
+                self.nDelivered = 0
+                self.trial = {'targetSequence': self.targetSequence, 'delivered': [], 'lags': []}
+            elif color == restColour and self.trial is not None:
+                self.endTrial()
+
+        def endTrial(self):
+            for handler in self.winHandle.handlers:  # what the key capture recorded
+                if hasattr(handler, 'recorded'):
+                    self.trial['recorded'] = handler.recorded()[0]
+            trials.append(self.trial)
+            self.trial = None
+            self.keys, self.nDelivered = np.zeros(0, dtype=int), 0
+
+        def deliverPresses(self):
+            now = simulatedTime.now()
+            while self.nDelivered < len(self.keys) and self.times[self.nDelivered] <= now:
+                thisKey = int(self.keys[self.nDelivered])
+                for handler in reversed(self.winHandle.handlers):
+                    if hasattr(handler, 'on_key_press'):
+                        handler.on_key_press(digitSymbols[thisKey], 0)
+                self.trial['delivered'].append(thisKey)
+                self.trial['lags'].append(now - self.times[self.nDelivered])  # how late the loop picked it up
+                self.nDelivered += 1
+
+        def close(self):
+            pass
+
+    class Stimulus(object):
+        def __init__(self, win=None, *args, **kwargs):
+            self.win = win
+            self.name = kwargs.get('name', '')
+            self.setText(kwargs.get('text', ''))
+
+        def setText(self, text):
+            self.text = text
+            if self.name == 'sequenceText':  # the typist reads the target sequence off the screen
+                self.win.targetSequence = text
+
+        def draw(self):
+            pass
+
+        def setAutoDraw(self, value):
+            pass
+
+        def setOpacities(self, value):
+            pass
+
+    # event
+    def getKeys(keyList=None, **kwargs):
+        if state['window'] is not None:
+            state['window'].deliverPresses()
+        return []
+
+    def waitKeys(keyList=None, **kwargs):
+        return ['space']
+
+    def clearEvents(eventType=None):
+        pass
+
+    # gui: dialogs are answered from responses (first option for lists) and always OK'd
+    class Dlg(object):
+        OK = True
+
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def addText(self, text):
+            pass
+
+        def show(self):
+            return True
+
+    class DlgFromDict(Dlg):
+        def __init__(self, dictionary, title='', order=(), **kwargs):
+            for name, value in dictionary.items():
+                if name in responses:
+                    dictionary[name] = responses[name]
+                elif isinstance(value, list):
+                    dictionary[name] = value[0]
+
+    # data
+    def createFactorialTrialList(factors):
+        names = list(factors.keys())
+        return [dict(zip(names, levels)) for levels in itertools.product(*[factors[name] for name in names])]
+
+    # pyglet key handling
+    class KeyStateHandler(dict):
+        def on_key_press(self, symbol, modifiers):
+            self[symbol] = True
+
+        def on_key_release(self, symbol, modifiers):
+            self[symbol] = False
+
+    modules = {}
+    for name, contents in [('psychopy.core', {'Clock': Clock, 'CountdownTimer': CountdownTimer, 'quit': quit}),
+                           ('psychopy.visual', {'Window': Window, 'TextStim': Stimulus, 'Circle': Stimulus,
+                                                'ElementArrayStim': Stimulus}),
+                           ('psychopy.event', {'getKeys': getKeys, 'waitKeys': waitKeys, 'clearEvents': clearEvents}),
+                           ('psychopy.gui', {'Dlg': Dlg, 'DlgFromDict': DlgFromDict}),
+                           ('psychopy.data', {'createFactorialTrialList': createFactorialTrialList}),
+                           ('pyglet.window.key', dict(keySymbols, KeyStateHandler=KeyStateHandler))]:
+        module = types.ModuleType(name)
+        module.__dict__.update(contents)
+        modules[name] = module
+    modules['psychopy'] = types.ModuleType('psychopy')
+    for name in ['core', 'visual', 'event', 'gui', 'data']:
+        setattr(modules['psychopy'], name, modules['psychopy.' + name])
+    modules['pyglet'] = types.ModuleType('pyglet')
+    modules['pyglet.window'] = types.ModuleType('pyglet.window')
+    modules['pyglet.window'].key = modules['pyglet.window.key']
+    modules['pyglet'].window = modules['pyglet.window']
+    return modules
+
+# A routine to run one session of fingerTapping.py headless
+# the data directory (and its data/ subdirectory, created if needed) is used as the working directory, so running
+# again with the same participant continues with their next session. Returns a summary of the run
+def runSession(typist, participant='901', workDir='simulation', speed=100.0, practice=False, frameTiming=True):
+    if not os.path.isdir(os.path.join(workDir, 'data')):
+        os.makedirs(os.path.join(workDir, 'data'))
+    responses = {'participant': str(participant), 'practice mode': practice,
+                 'override automated counter-balancing': False, 'record frame timing': frameTiming,
+                 'age': '30'}
+    trials = []
+    simulatedTime = SimulatedTime(speed)
+    standIns = makeStandIns(simulatedTime, typist, responses, trials)
+    replaced = dict((name, sys.modules.get(name)) for name in standIns)
+    sys.modules.update(standIns)
+    scriptDir = os.path.dirname(scriptFile)
+    if scriptDir not in sys.path:
+        sys.path.insert(0, scriptDir)
+    for name in ['keyCapture', 'markerArray']:  # make sure these bind to the stand-ins
+        sys.modules.pop(name, None)
+    startDir = os.getcwd()
+    startTime = time.time()
+    try:
+        os.chdir(workDir)
+        runpy.run_path(scriptFile, run_name='__main__')
+    except SessionEnded:
+        pass
+    finally:
+        os.chdir(startDir)
+        for name, module in replaced.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+        for name in ['keyCapture', 'markerArray']:
+            sys.modules.pop(name, None)
+
+    delivered = sum(len(trial['delivered']) for trial in trials)
+    lost = sum(len(trial['delivered']) - len(trial.get('recorded', [])) for trial in trials)
+    reordered = sum(trial['delivered'][:len(trial.get('recorded', []))] != trial.get('recorded', [])
+                    for trial in trials)
+    lags = np.concatenate([np.asarray(trial['lags']) for trial in trials] + [np.zeros(0)])
+    return {'trials': trials,
+            'keysDelivered': delivered,
+            'keysLost': lost,
+            'trialsReordered': int(reordered),
+            'meanLag': float(lags.mean()) if len(lags) else float('nan'),  # simulated seconds
+            'maxLag': float(lags.max()) if len(lags) else float('nan'),
+            'simulatedTime': simulatedTime.now(),
+            'realTime': time.time() - startTime}
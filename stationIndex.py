@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Title: Shared session index for running the finger tapping task on several stations
+A station running a participant holds a lock file for them in the shared data directory (data/P<participant>.lock),
+created with O_EXCL so only one station can ever hold it: two stations can never run the same participant at the same
+time, and as the session to run is worked out from the records while the lock is held, never both start the same
+session. Lock files are used rather than a database because file locking on network shares is unreliable, while
+exclusive creation of a file is not.
+
+Each station also keeps a small status file per participant (data/P<participant>_station.json) with the session it is
+running and how far it has got, so a monitor can follow every station by reading those instead of the data files.
+A station that crashed leaves its lock behind: the same computer takes it back automatically once the process that
+held it is no longer running, otherwise it has to be taken over explicitly. The lock file records the holder's process
+id for this, and a station only removes a lock (or writes the status) while the lock is still its own.
+
+Run from the command line to watch progress, e.g. 'python stationIndex.py --dataDir data'
+
+"""
+
+# import useful modules
+import argparse
+import errno
+import glob
+import json
+import os
+import socket
+import time
+from trialRecords import replaceFile, sessionTrials
+
+# raised when a participant cannot be claimed because another station holds their lock
+class SessionClaimed(Exception):
+    def __init__(self, participant, station, updated):
+        Exception.__init__(self, 'Participant %s is being run on %s (last update %s)' % (
+            participant, station, time.strftime('%H:%M:%S', time.localtime(updated))))
+        self.participant = participant
+        self.station = station
+        self.updated = updated
+
+# A routine to get a name for this station (computer name and process id)
+def stationName():
+    return '%s:%i' % (socket.gethostname(), os.getpid())
+
+# A routine to check whether a process on this computer is still running
+def processRunning(pid):
+    if os.name == 'nt':  # os.kill would end the process on windows, so ask windows about it instead
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return kernel32.GetLastError() == 5  # access denied: it exists but belongs to someone else
+        exitCode = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(exitCode))
+        kernel32.CloseHandle(handle)
+        return exitCode.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)  # signal 0 only checks the process exists
+    except OSError as error:
+        return error.errno == errno.EPERM  # exists but belongs to someone else
+    return True
+
+# A routine to read a JSON file written by another station; returns None if it is missing or still being written
+def readJson(fileName):
+    try:
+        with open(fileName, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+# The session index in a data directory, as seen by one station
+class SessionIndex(object):
+
+    def __init__(self, dataDir='data', station=None, staleAfter=900.0):
+        self.dataDir = dataDir
+        self.station = station or stationName()
+        self.host = self.station.split(':')[0]
+        self.staleAfter = staleAfter  # seconds without an update before a running station counts as not responding
+        self.participant = None  # the participant whose lock this station holds
+        self.status = None
+
+    def lockFile(self, participant):
+        return os.path.join(self.dataDir, 'P%s.lock' % participant)
+
+    def statusFile(self, participant):
+        return os.path.join(self.dataDir, 'P%s_station.json' % participant)
+
+    # A routine to get when the station running a participant last showed it was still running
+    def lastUpdate(self, participant):
+        status = readJson(self.statusFile(participant))
+        if status is not None:
+            return status['updated']
+        if os.path.exists(self.lockFile(participant)):
+            return os.path.getmtime(self.lockFile(participant))
+        return 0.0
+
+    # A routine to check whether a lock was left by a process on this computer that is no longer running
+    def crashedHere(self, holder):
+        return holder.get('host') == self.host and 'pid' in holder and not processRunning(holder['pid'])
+
+    # A routine to check this station still holds the lock it claimed (it could have been taken over)
+    def ownsLock(self):
+        holder = readJson(self.lockFile(self.participant)) or {}
+        return holder.get('station') == self.station
+
+    # A routine to take the lock for a participant. Raises SessionClaimed if another station holds it, unless force
+    # is set (e.g. the researcher knows that station has crashed). A lock left by a process on this computer that is
+    # no longer running is taken back
+    def claim(self, participant, force=False):
+        participant = str(participant)
+        lockFile = self.lockFile(participant)
+        for attempt in range(20):
+            try:
+                descriptor = os.open(lockFile, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except OSError as error:
+                if error.errno != errno.EEXIST:
+                    raise
+            holder = readJson(lockFile) or {}  # the lock exists: who holds it?
+            if not (force or self.crashedHere(holder)):
+                raise SessionClaimed(participant, holder.get('station', 'another station'), self.lastUpdate(participant))
+            try:
+                os.remove(lockFile)  # a crashed station's lock (or one being taken over): remove it and try again
+            except OSError:
+                time.sleep(0.1)
+        else:  # the lock could not be removed
+            raise SessionClaimed(participant, holder.get('station', 'another station'), self.lastUpdate(participant))
+        with os.fdopen(descriptor, 'w') as f:
+            json.dump({'station': self.station, 'host': self.host, 'pid': os.getpid(), 'time': time.time()}, f)
+        self.participant = participant
+        self.status = {'participant': participant, 'station': self.station, 'session': None, 'status': 'starting',
+                       'started': time.time(), 'trialsDone': 0, 'trialsTotal': 0, 'sessionType': ''}
+        self.writeStatus()
+
+    # A routine to record the session being run (once it has been worked out, while holding the lock)
+    def start(self, session):
+        if self.participant is not None:
+            self.status.update({'session': session, 'status': 'running', 'trialsTotal': sum(
+                total for sessionType, total in sessionTrials.items() if int(sessionType[0]) == session)})
+            self.writeStatus()
+
+    # A routine to record progress through the session (also shows the station is still running)
+    def update(self, trialsDone, sessionType=''):
+        if self.participant is not None and self.ownsLock():
+            self.status.update({'trialsDone': trialsDone, 'sessionType': sessionType})
+            self.writeStatus()
+
+    # A routine to mark the session as finished and give up the lock
+    def finish(self):
+        self.unlock('finished')
+
+    # A routine to give up the lock without finishing, e.g. when the user quits
+    def release(self):
+        self.unlock('stopped')
+
+    # A routine to give up the lock, recording why in the status file. Does nothing to either if the lock has been
+    # taken over, as they then belong to the station that took it
+    def unlock(self, status):
+        if self.participant is not None:
+            if self.ownsLock():
+                self.status['status'] = status
+                self.writeStatus()
+                try:
+                    os.remove(self.lockFile(self.participant))
+                except OSError:
+                    pass
+            self.participant = None
+
+    # A routine to write the status file, replacing it in one step so the monitor never reads half a file
+    def writeStatus(self):
+        self.status['updated'] = time.time()
+        statusFile = self.statusFile(self.participant)
+        temporaryFile = '%s.%s.tmp' % (statusFile, self.station.replace(':', '_'))
+        with open(temporaryFile, 'w') as f:
+            json.dump(self.status, f)
+        replaceFile(temporaryFile, statusFile)
+
+    # A routine to get the status of every participant updated since a time (all of them by default), oldest first
+    def changes(self, since=0.0):
+        rows = []
+        for statusFile in glob.glob(os.path.join(self.dataDir, 'P*_station.json')):
+            if os.path.getmtime(statusFile) < since - 1:  # not changed (allowing for coarse file times)
+                continue
+            status = readJson(statusFile)
+            if status is not None and status['updated'] > since:
+                rows.append(status)
+        return sorted(rows, key=lambda status: status['updated'])
+
+# A routine to print one line of a participant's status
+def printStatus(row, status):
+    print('%s  P%-5s session %s %-3s %2i/%-2i trials  %-14s %s' % (
+        time.strftime('%H:%M:%S', time.localtime(row['updated'])), row['participant'], row['session'],
+        row['sessionType'], row['trialsDone'], row['trialsTotal'], status, row['station']))
+
+# A routine to print every station's progress as it changes, until interrupted
+def monitor(dataDir='data', interval=1.0):
+    index = SessionIndex(dataDir, station='monitor')
+    since = 0.0
+    running = {}  # latest status of the participants being run, to spot stations that stop updating
+    try:
+        while True:
+            for row in index.changes(since):
+                printStatus(row, row['status'])
+                running[row['participant']] = row
+                since = max(since, row['updated'])
+            for participant, row in list(running.items()):
+                if row['status'] not in ['starting', 'running']:
+                    del running[participant]
+                elif time.time() - row['updated'] > index.staleAfter:
+                    printStatus(row, 'not responding')
+                    del running[participant]  # reported once, until it updates again
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Show the progress of every station running the task')
+    parser.add_argument('--dataDir', default='data', help='the shared data directory')
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between checks')
+    args = parser.parse_args()
+    monitor(args.dataDir, args.interval)
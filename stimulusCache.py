@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Title: Pre-built stimuli for the finger tapping task
+Builds one stimulus per label up front, so changing what is displayed (e.g. the rest countdown) is just swapping which
+stimulus is drawn, with no text layout during the task.
+
+"""
+
+# A set of pre-built stimuli, of which at most one is displayed at a time
+class StimulusCache(object):
+
+    # makeStimulus(text) builds a stimulus showing text; labels maps each key to the text to show for it
+    def __init__(self, makeStimulus, labels):
+        self.stimuli = dict((key, makeStimulus(text)) for key, text in labels.items())
+        self.shown = None  # key of the stimulus currently displayed
+
+    # A routine to display the stimulus for key continuously (does nothing if it is already displayed)
+    def show(self, key):
+        if key == self.shown:
+            return
+        if self.shown is not None:
+            self.stimuli[self.shown].setAutoDraw(False)
+        self.stimuli[key].setAutoDraw(True)
+        self.shown = key
+
+    # A routine to stop displaying any stimulus
+    def hide(self):
+        if self.shown is not None:
+            self.stimuli[self.shown].setAutoDraw(False)
+        self.shown = None
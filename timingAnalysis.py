@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Title: Key press timing analysis for the finger tapping task
+Motor timing and chunking measures computed from the time of each key press: inter-key intervals, the latency of each
+transition within the target sequence, pauses within vs. between completed sequences, and speed/accuracy over the
+course of the trial. All trials of a session are analysed together in one call.
+
+"""
+
+# import useful modules
+import numpy as np
+from scoring import packStreams, detectorPath
+
+# A routine to average values within groups (e.g. per trial); groups with no values get nan
+def groupMean(groups, values, nGroups):
+    counts = np.bincount(groups, minlength=nGroups)
+    totals = np.bincount(groups, weights=values, minlength=nGroups)
+    means = np.full(nGroups, np.nan)
+    means[counts > 0] = totals[counts > 0] / counts[counts > 0]
+    return means
+
+# Routine for analysing the timing of the response streams of many trials
+# streams and times are lists (one entry per trial) of key codes and key press times in seconds from the start of the
+# trial. targetSequence is a single sequence or a list with one per trial (e.g. a session with old and new sequences)
+# a trial with no times (e.g. from a csv file saved before times were recorded) gets nan for every measure; any other
+# trial must have one time per key press, otherwise a ValueError names the trial
+# returns a dictionary of per-trial arrays:
+#   'interval'          all inter-key intervals (flat, trial n is interval[intervalOffsets[n]:intervalOffsets[n + 1]])
+#   'meanInterval'      mean inter-key interval
+#   'medianInterval'    median inter-key interval
+#   'transitionLatency' mean latency of each transition within completed sequences (trials x sequence length - 1)
+#   'withinPause'       mean interval between keys of the same completed sequence
+#   'betweenPause'      mean interval from the end of one completed sequence to the start of the next
+#   'binSpeed'          completed sequences in each time bin (trials x bins)
+#   'binAccuracy'       proportion of key presses in each time bin that are part of a completed sequence
+def analyseTiming(streams, times, targetSequence, binWidth=5.0, trialLength=30.0):
+    values, offsets = packStreams(streams)
+    nTrials = len(offsets) - 1
+    lengths = np.diff(offsets)
+    times = [np.asarray(trialTimes, dtype=float) for trialTimes in times]
+    if len(times) != nTrials:
+        raise ValueError('%i response streams but %i lists of key press times' % (nTrials, len(times)))
+    untimed = np.zeros(nTrials, dtype=bool)  # trials without key press times
+    for n in range(nTrials):
+        if len(times[n]) == lengths[n]:
+            continue
+        if len(times[n]):
+            raise ValueError('trial %i has %i key presses but %i key press times' % (n, lengths[n], len(times[n])))
+        untimed[n] = True
+        times[n] = np.zeros(lengths[n])  # stand-in times so the trial lines up, its measures are set to nan below
+    times = np.concatenate(times + [np.zeros(0)])
+    trial = np.repeat(np.arange(nTrials), lengths)  # which trial each key press belongs to
+    if isinstance(targetSequence, str):  # the same target sequence for every trial
+        sequenceLength = len(targetSequence)
+        targetSequence = [targetSequence] * nTrials
+    else:  # one per trial, all the same length (there may be no trials at all)
+        sequenceLength = max([len(sequence) for sequence in targetSequence] + [1])
+    nBins = int(np.ceil(trialLength / binWidth))
+
+    # inter-key intervals, each belonging to the later of its two key presses
+    follows = np.ones(len(values), dtype=bool)  # key press has a previous press in the same trial
+    follows[offsets[:-1][lengths > 0]] = False
+    interval = np.concatenate([[0], np.diff(times)])[follows]
+    intervalTrial = trial[follows]
+    interval[untimed[intervalTrial]] = np.nan
+    intervalOffsets = np.zeros(nTrials + 1, dtype=np.int64)
+    intervalOffsets[1:] = np.cumsum(np.maximum(lengths - 1, 0))
+    medianInterval = np.full(nTrials, np.nan)
+    for n in np.nonzero(np.diff(intervalOffsets))[0]:  # median has no grouped form in numpy, one call per trial
+        medianInterval[n] = np.median(interval[intervalOffsets[n]:intervalOffsets[n + 1]])
+
+    # find the completed sequences in every trial, one pass per distinct target sequence
+    starts = []
+    inSequence = np.zeros(len(values), dtype=bool)  # key press is part of a completed sequence
+    for sequence in sorted(set(targetSequence)):
+        chosen = np.array([thisSequence == sequence for thisSequence in targetSequence])
+        keep = np.repeat(chosen, lengths)
+        subsetOffsets = np.zeros(chosen.sum() + 1, dtype=np.int64)
+        subsetOffsets[1:] = np.cumsum(lengths[chosen])
+        visitedPositions, step = detectorPath(values[keep], subsetOffsets, sequence)
+        starts.append(np.nonzero(keep)[0][visitedPositions[step == len(sequence)]])  # back to positions in values
+    starts = np.sort(np.concatenate(starts + [np.zeros(0, dtype=np.int64)]))
+    startTrial = trial[starts]
+    for j in range(sequenceLength):
+        inSequence[starts + j] = True
+
+    # latency of each transition within completed sequences
+    latency = times[starts[:, np.newaxis] + np.arange(1, sequenceLength)] - \
+              times[starts[:, np.newaxis] + np.arange(sequenceLength - 1)]  # sequences x transitions
+    transitionLatency = np.full((nTrials, sequenceLength - 1), np.nan)
+    for j in range(sequenceLength - 1):
+        transitionLatency[:, j] = groupMean(startTrial, latency[:, j], nTrials)
+    withinPause = groupMean(np.repeat(startTrial, sequenceLength - 1), latency.ravel(), nTrials)
+
+    # pauses between directly consecutive completed sequences
+    consecutive = (starts[1:] == starts[:-1] + sequenceLength) & (startTrial[1:] == startTrial[:-1])
+    pause = times[starts[1:][consecutive]] - times[starts[1:][consecutive] - 1]
+    betweenPause = groupMean(startTrial[1:][consecutive], pause, nTrials)
+
+    # speed and accuracy over the course of the trial, a sequence counts in the bin where it was completed
+    completedBin = np.clip((times[starts + sequenceLength - 1] // binWidth).astype(np.int64), 0, nBins - 1)
+    binSpeed = np.bincount(startTrial * nBins + completedBin, minlength=nTrials * nBins).reshape(nTrials, nBins)
+    binSpeed = binSpeed.astype(float)  # so untimed trials can be nan
+    keyBin = np.clip((times // binWidth).astype(np.int64), 0, nBins - 1)
+    keyCount = np.bincount(trial * nBins + keyBin, minlength=nTrials * nBins)
+    correctCount = np.bincount(trial * nBins + keyBin, weights=inSequence, minlength=nTrials * nBins)
+    binAccuracy = np.full(nTrials * nBins, np.nan)
+    binAccuracy[keyCount > 0] = correctCount[keyCount > 0] / keyCount[keyCount > 0]
+    binAccuracy = binAccuracy.reshape(nTrials, nBins)
+    for measure in [transitionLatency, withinPause, betweenPause, binSpeed, binAccuracy]:
+        measure[untimed] = np.nan
+
+    return {'interval': interval,
+            'intervalOffsets': intervalOffsets,
+            'meanInterval': groupMean(intervalTrial, interval, nTrials),
+            'medianInterval': medianInterval,
+            'transitionLatency': transitionLatency,
+            'withinPause': withinPause,
+            'betweenPause': betweenPause,
+            'binSpeed': binSpeed,
+            'binAccuracy': binAccuracy}
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Title: Append-only trial records for the finger tapping task
+Every trial is appended to the participant's record file (one JSON line per trial) and forced to disk as soon as the
+trial ends, so a crash or abort loses nothing already recorded. The usual P<participant>.csv data file is produced from
+the records on demand by compactRecords, which replaces it atomically.
+
+"""
+
+# import useful modules
+import json
+import os
+import numpy as np
+from trialStore import TrialStore
+
+sessionTrials = {'1a': 12, '2a': 3, '2b': 12, '3a': 3, '3b': 3}  # number of trials in each part of each session
+
+# A routine to turn numpy values into plain python ones so they can be written as JSON
+def plainValue(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+# A routine to check whether a file ends with a complete line
+def endsWithNewline(recordFile):
+    with open(recordFile, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+# A routine to durably append one trial (a dictionary of column name: value) to a record file
+def appendRecord(recordFile, newRow):
+    line = json.dumps(dict((name, plainValue(value)) for name, value in newRow.items()), sort_keys=True)
+    with open(recordFile, 'a') as f:
+        if f.tell() > 0 and not endsWithNewline(recordFile):  # a crash left a partly written line, start a new one
+            line = '\n' + line
+        f.write(line + '\n')
+        f.flush()
+        os.fsync(f.fileno())  # make sure the trial is on disk before carrying on
+
+# A routine to read all complete records from a record file
+# a partly written final line (e.g. from a crash while writing) is ignored
+def readRecords(recordFile):
+    records = []
+    with open(recordFile, 'r') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:  # incomplete line
+                continue
+    return records
+
+# A routine to read the complete records of a record file from the last one backwards, a block at a time, so the end
+# of a long file can be read without reading all of it
+def recordsFromEnd(recordFile, blockSize=4096):
+    with open(recordFile, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        tail = b''
+        while position > 0:
+            step = min(blockSize, position)
+            position -= step
+            f.seek(position)
+            lines = (f.read(step) + tail).split(b'\n')
+            # lines[0] may be cut off by the block boundary unless we have reached the start of the file, so it is
+            # kept to complete with the next block
+            tail = lines[0] if position > 0 else b''
+            for line in reversed(lines if position == 0 else lines[1:]):
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                except ValueError:  # empty or incomplete line
+                    continue
+                yield record
+
+# A routine to find where a participant is up to from their record file
+# returns the session to run and the number of trials already recorded for each part of it: session 1 and no trials if
+# nothing is recorded, the next session and no trials if the last session was completed, otherwise the last session
+# (which was stopped part way, e.g. by a crash or the user quitting) and the trials it has so far
+# only the records of the last session are read, from the end of the file back to the first record of an earlier one
+def sessionProgress(recordFile):
+    session = None
+    trialsDone = {}
+    for record in recordsFromEnd(recordFile):
+        sessionType = str(record['session'])
+        if session is None:
+            session = int(sessionType[0])  # the last record is from the last session
+        elif int(sessionType[0]) != session:  # reached an earlier session
+            break
+        trialsDone[sessionType] = trialsDone.get(sessionType, 0) + 1
+    if session is None:
+        return 1, {}
+    if all(trialsDone.get(sessionType, 0) >= total for sessionType, total in sessionTrials.items()
+           if int(sessionType[0]) == session):
+        return session + 1, {}
+    return session, trialsDone
+
+# A routine to take every trial of one session out of a record file (e.g. to run the session again from the start)
+# the trials taken out are appended to discardFile, so nothing recorded is ever lost
+def discardRecords(recordFile, session, discardFile):
+    kept = []
+    for record in readRecords(recordFile):
+        if int(str(record['session'])[0]) == session:
+            appendRecord(discardFile, record)
+        else:
+            kept.append(record)
+    temporaryFile = recordFile + '.tmp'
+    with open(temporaryFile, 'w') as f:
+        for record in kept:
+            f.write(json.dumps(record, sort_keys=True) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    replaceFile(temporaryFile, recordFile)
+
+# A routine to replace one file with another in a single step, so readers see either the old or the new file
+def replaceFile(source, destination):
+    if hasattr(os, 'replace'):  # python 3
+        os.replace(source, destination)
+    elif os.name == 'nt':  # python 2 on windows cannot rename over an existing file
+        os.remove(destination)
+        os.rename(source, destination)
+    else:
+        os.rename(source, destination)
+
+# A routine to write every trial of a TrialStore to a new record file (e.g. to start records from an old csv file)
+def writeRecords(recordFile, store):
+    frame = store.toDataFrame()
+    temporaryFile = recordFile + '.tmp'
+    with open(temporaryFile, 'w') as f:
+        for index, row in frame.iterrows():
+            f.write(json.dumps(dict((name, plainValue(value)) for name, value in row.items()), sort_keys=True) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    replaceFile(temporaryFile, recordFile)
+
+# A routine to build the csv data file from a record file
+# the csv is written to a temporary file first and then swapped in, so a failed save never leaves a half-written file
+def compactRecords(recordFile, fileName):
+    store = TrialStore()
+    for record in readRecords(recordFile):
+        store.append(record)
+    temporaryFile = fileName + '.tmp'
+    store.toCsv(temporaryFile)
+    replaceFile(temporaryFile, fileName)
+    return store
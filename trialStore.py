@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Title: Columnar trial store for the finger tapping task
+Accumulates trial data in preallocated columns. The response stream and key press times of every trial are kept in one
+flat values array per column plus an offsets array, so adding a trial never copies earlier trials and the streams can
+be handed straight to the batch scoring and timing routines. A DataFrame is only built when saving to csv.
+
+A store can also be saved in binary form: a directory with one .npy file per column (streams as integer arrays) and a
+small header.json with the number of trials and the columns saved, so the columns can be memory-mapped.
+Run 'python trialStore.py data/P*.csv' to convert existing csv data files.
+
+"""
+
+# import useful modules
+import argparse
+import glob
+import json
+import os
+import shutil
+import time
+import numpy as np
+from frameTiming import summaryColumns
+
+# columns holding one value per trial, with their types
+scalarColumns = [('participant', object), ('session', object), ('targetSequence', object), ('sequenceType', object),
+                 ('trial', np.int64), ('speed', float), ('errors', float), ('accuracy', float)] + \
+                [(name, float) for name in summaryColumns]  # frame timing summary (nan when not recorded)
+# columns holding a list of values per trial, with the type of the values
+raggedColumns = [('stream', np.int8), ('keyTimes', float)]
+# column order of the saved data files
+columnOrder = ['participant', 'session', 'targetSequence', 'sequenceType', 'trial', 'stream', 'keyTimes', 'speed',
+               'errors', 'accuracy'] + summaryColumns
+# columns saved under an earlier name: earlier name: current name
+renamedColumns = {'keyLatencyMean': 'dispatchToFlipMean', 'keyLatencyMax': 'dispatchToFlipMax'}
+
+# A routine to make an empty column of n values (missing numbers are nan)
+def emptyColumn(dtype, n):
+    if dtype is float:
+        return np.full(n, np.nan)
+    return np.zeros(n, dtype=dtype)
+
+# A routine to turn a list saved by to_csv (e.g. '[4, 1, 3]') back into a list of numbers
+def parseList(text, dtype):
+    if not isinstance(text, str):  # missing (e.g. keyTimes in files saved before they were recorded)
+        return np.zeros(0, dtype=dtype)
+    text = text.strip('[]').replace(',', ' ')
+    return np.array(text.split(), dtype=float).astype(dtype)
+
+# A store of trial data
+class TrialStore(object):
+
+    def __init__(self, capacity=64):
+        self.nTrials = 0
+        self.scalars = dict((name, emptyColumn(dtype, capacity)) for name, dtype in scalarColumns)
+        self.values = dict((name, np.zeros(capacity * 256, dtype=dtype)) for name, dtype in raggedColumns)
+        self.offsets = dict((name, np.zeros(capacity + 1, dtype=np.int64)) for name, dtype in raggedColumns)
+
+    def __len__(self):
+        return self.nTrials
+
+    # A routine to make sure there is room for one more trial, with lengths[name] values in each list column
+    def reserve(self, lengths):
+        if self.nTrials == len(self.scalars['trial']):  # out of rows, double the capacity
+            extra = max(self.nTrials, 1)
+            for name, dtype in scalarColumns:
+                self.scalars[name] = np.append(self.scalars[name], emptyColumn(dtype, extra))
+            for name in self.offsets:
+                self.offsets[name] = np.append(self.offsets[name], np.zeros(extra, dtype=np.int64))
+        for name, length in lengths.items():
+            needed = self.offsets[name][self.nTrials] + length
+            # out of room, or mapped read only from disk: copy into a new array at least twice the size
+            if needed > len(self.values[name]) or not self.values[name].flags.writeable:
+                grown = np.zeros(max(needed, 2 * len(self.values[name])), dtype=self.values[name].dtype)
+                grown[:len(self.values[name])] = self.values[name]
+                self.values[name] = grown
+
+    # A routine to add a trial, given as a dictionary of column name: value (like a row of the saved data)
+    def append(self, newRow):
+        newRow = dict(newRow)
+        ragged = dict((name, np.asarray(newRow.pop(name, []), dtype=dtype)) for name, dtype in raggedColumns)
+        self.reserve(dict((name, len(items)) for name, items in ragged.items()))
+        n = self.nTrials
+        for name, value in newRow.items():
+            self.scalars[renamedColumns.get(name, name)][n] = value
+        for name, items in ragged.items():
+            start = self.offsets[name][n]
+            self.values[name][start:start + len(items)] = items
+            self.offsets[name][n + 1] = start + len(items)
+        self.nTrials += 1
+
+    # A routine to get a column with one value per trial
+    def column(self, name):
+        return self.scalars[name][:self.nTrials]
+
+    # A routine to get a list column as flat values and offsets (trial n is values[offsets[n]:offsets[n + 1]])
+    def ragged(self, name):
+        offsets = self.offsets[name][:self.nTrials + 1]
+        return self.values[name][:offsets[-1]], offsets
+
+    # A routine to get a list column as one array per trial
+    def lists(self, name):
+        values, offsets = self.ragged(name)
+        return [values[offsets[n]:offsets[n + 1]] for n in range(self.nTrials)]
+
+    # A routine to build a DataFrame in the layout of the saved data files
+    def toDataFrame(self):
+        import pandas as pd  # pandas is slow to import, so only load it when it is needed
+        data = dict((name, self.column(name)) for name, dtype in scalarColumns)
+        for name, dtype in raggedColumns:
+            data[name] = [items.tolist() for items in self.lists(name)]
+        return pd.DataFrame(data, columns=columnOrder)
+
+    # A routine to save the store as a csv file (same layout as saving the DataFrame)
+    def toCsv(self, fileName):
+        self.toDataFrame().to_csv(fileName)
+
+    # A routine to build a store from a DataFrame in the layout of the saved data files
+    @classmethod
+    def fromDataFrame(cls, frame):
+        store = cls(capacity=max(len(frame), 1))
+        frame = frame.rename(columns=renamedColumns)
+        for index, row in frame.iterrows():
+            newRow = dict((name, row[name]) for name, dtype in scalarColumns if name in row)
+            for name, dtype in raggedColumns:
+                value = row[name] if name in row else None
+                newRow[name] = value if isinstance(value, list) else parseList(value, dtype)
+            store.append(newRow)
+        return store
+
+    # A routine to save the store in binary form to a directory
+    # everything is written to a temporary directory which then takes the place of any earlier store, so a save that
+    # fails part way (e.g. because an analysis has the old columns memory-mapped) leaves the earlier store as it was
+    def save(self, directory):
+        temporary = directory + '.tmp'
+        if os.path.isdir(temporary):  # left by an earlier save that failed
+            shutil.rmtree(temporary)
+        os.makedirs(temporary)
+        for name, dtype in scalarColumns:
+            column = self.column(name)
+            np.save(os.path.join(temporary, name + '.npy'), column.astype(str) if dtype is object else column)
+        for name, dtype in raggedColumns:
+            values, offsets = self.ragged(name)
+            np.save(os.path.join(temporary, name + '_values.npy'), values)
+            np.save(os.path.join(temporary, name + '_offsets.npy'), offsets)
+        header = {'nTrials': self.nTrials,
+                  'scalarColumns': [name for name, dtype in scalarColumns],
+                  'raggedColumns': [name for name, dtype in raggedColumns]}
+        with open(os.path.join(temporary, 'header.json'), 'w') as f:  # header last, so it only exists once complete
+            json.dump(header, f)
+        replaceDirectory(temporary, directory)
+
+    # A routine to load a store saved in binary form. With mmap the columns are memory-mapped (read only until a
+    # trial is added, which copies them into memory)
+    @classmethod
+    def load(cls, directory, mmap=True):
+        mode = 'r' if mmap else None
+        header = readHeader(directory)
+        store = cls(capacity=0)
+        store.nTrials = header['nTrials']
+        saved = dict((renamedColumns.get(name, name), name) for name in header['scalarColumns'])  # name: saved name
+        for name, dtype in scalarColumns:
+            if name not in saved:  # saved before this column existed
+                store.scalars[name] = emptyColumn(dtype, store.nTrials)
+                continue
+            column = np.load(os.path.join(directory, saved[name] + '.npy'), mmap_mode=mode)
+            store.scalars[name] = column.astype(object) if dtype is object else column
+        for name, dtype in raggedColumns:
+            store.values[name] = np.load(os.path.join(directory, name + '_values.npy'), mmap_mode=mode)
+            store.offsets[name] = np.load(os.path.join(directory, name + '_offsets.npy'), mmap_mode=mode)
+        return store
+
+    # A routine to load a store from a saved csv file
+    @classmethod
+    def fromCsv(cls, fileName):
+        import pandas as pd  # pandas is slow to import, so only load it when it is needed
+        return cls.fromDataFrame(pd.read_csv(fileName, index_col=0))
+
+# A routine to put a directory in the place of another one. The old directory is moved aside first (a directory
+# cannot be renamed over another), then deleted; if it cannot be deleted yet, e.g. while its files are still open, it
+# is left to be cleared by a later call
+def replaceDirectory(source, destination):
+    for old in glob.glob(destination + '.old.*'):
+        shutil.rmtree(old, ignore_errors=True)
+    old = None
+    if os.path.isdir(destination):
+        old = destination + '.old.%i' % int(time.time() * 1000)
+        os.rename(destination, old)
+    os.rename(source, destination)
+    if old is not None:
+        shutil.rmtree(old, ignore_errors=True)
+
+# A routine to read the header of a store saved with TrialStore.save, without loading any trial data
+# the header holds the number of trials and the columns saved
+def readHeader(directory):
+    with open(os.path.join(directory, 'header.json'), 'r') as f:
+        return json.load(f)
+
+# A routine to convert saved csv data files into stores saved with TrialStore.save (next to each csv file)
+def convertCsv(fileNames):
+    for fileName in fileNames:
+        directory = os.path.splitext(fileName)[0] + '_store'
+        TrialStore.fromCsv(fileName).save(directory)
+        print('Converted %s to %s' % (fileName, directory))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert finger tapping csv data files to binary stores')
+    parser.add_argument('fileNames', nargs='+', help='csv data files, e.g. data/P*.csv')
+    convertCsv(parser.parse_args().fileNames)